@@ -0,0 +1,117 @@
+"""Measure how fast lines of `cflow` output are parsed.
+
+Compares the tokenizer used by `cflow2nx` with the parser
+that preceded it, which used several uncompiled regular
+expressions per line.
+
+Also compares the rate at which `cflow2nx` builds a graph
+with the rate at which the graph is unpickled.
+`cflow_graphs` parses in worker processes, and the parent
+only unpickles, so the ratio of these rates bounds
+how many workers the parent keeps up with.
+
+Pass a file with recorded output of `cflow -l` to measure on it:
+
+```shell
+cflow -l foo.c > foo.cflow
+python parse_cflow.py foo.cflow
+```
+
+Without arguments, synthetic output is generated.
+"""
+from __future__ import print_function
+import pickle
+import re
+import sys
+import timeit
+
+from pycflow2dot import pycflow2dot as cflow2dot
+
+
+def legacy_tokenize(line):
+    """Return tokens as parsed before the compiled tokenizer."""
+    src_line_no = re.findall(':.*>', line)
+    if src_line_no:
+        src_line_no = int(src_line_no[0][1:-1])
+    else:
+        src_line_no = -1
+    s = re.sub(r'\(.*$', '', line)
+    s = re.sub(r'^\{\s*', '', s)
+    s = re.sub(r'\}\s*', r'\t', s)
+    (nest_level, func_name) = re.split(r'\t', s)
+    return (int(nest_level), func_name, src_line_no)
+
+
+def synthetic_output(n_lines):
+    """Return `list` of `n_lines` lines that look like `cflow -l` output."""
+    lines = list()
+    for i in range(n_lines):
+        level = i % 7
+        indent = '    ' * level
+        if i % 3:
+            line = (
+                '{{{level:4d}}} {indent}func_{i}() '
+                '<int func_{i} (int x, char *y) at file.c:{i}>:').format(
+                    level=level, indent=indent, i=i)
+        else:
+            line = '{{{level:4d}}} {indent}printf()'.format(
+                level=level, indent=indent)
+        lines.append(line)
+    return lines
+
+
+def measure(tokenize, lines, repeat=5):
+    """Return lines per second that `tokenize` parses."""
+    def run():
+        for line in lines:
+            tokenize(line)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    return len(lines) / best
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'rb') as f:
+            raw_lines = [line for line in f.read().splitlines() if line]
+    else:
+        raw_lines = [
+            line.encode('ascii') for line in synthetic_output(10**5)]
+    lines = [line.decode('utf-8') for line in raw_lines]
+    # same tokens, except where the legacy parser was wrong
+    n_same = 0
+    for line in lines:
+        nest_level, func_name, _, src_line, _ = (
+            cflow2dot._tokenize_cflow_line(line))
+        n_same += (
+            legacy_tokenize(line) == (nest_level, func_name, src_line))
+    print('lines: {n}, identically parsed: {same}'.format(
+        n=len(lines), same=n_same))
+    results = [
+        ('legacy', measure(legacy_tokenize, lines)),
+        ('compiled (str)', measure(cflow2dot._tokenize_cflow_line, lines)),
+        ('compiled (bytes)',
+            measure(cflow2dot._tokenize_cflow_line, raw_lines))]
+    for name, rate in results:
+        print('{name:>20}: {rate:12,.0f} lines/s'.format(
+            name=name, rate=rate))
+    for parse in (cflow2dot.cflow2nx, cflow2dot.cflow2compact):
+        measure_workers(parse, raw_lines)
+
+
+def measure_workers(parse, raw_lines, repeat=5):
+    """Print rates of parsing by `parse`, and of unpickling."""
+    data = pickle.dumps(
+        parse(raw_lines, 'file.c'), pickle.HIGHEST_PROTOCOL)
+    parse_rate = len(raw_lines) / min(timeit.repeat(
+        lambda: parse(raw_lines, 'file.c'), number=1, repeat=repeat))
+    unpickle_rate = len(raw_lines) / min(timeit.repeat(
+        lambda: pickle.loads(data), number=1, repeat=repeat))
+    print('{name:>20}: {rate:12,.0f} lines/s'.format(
+        name=parse.__name__, rate=parse_rate))
+    print('{name:>20}: {rate:12,.0f} lines/s, {n:.1f} workers'.format(
+        name='unpickle', rate=unpickle_rate,
+        n=unpickle_rate / parse_rate))
+
+
+if __name__ == '__main__':
+    main()
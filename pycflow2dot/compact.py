@@ -0,0 +1,465 @@
+"""Compact representation of call graphs.
+
+Function names are interned to integer ids,
+node attributes are stored in arrays, and
+edges in compressed sparse row (CSR) form.
+"""
+# Copyright 2013-2020 Ioannis Filippidis
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from __future__ import absolute_import
+from array import array
+from bisect import bisect_left
+
+import networkx as nx
+
+
+class CompactCallGraph(object):
+    """Call graph with integer-interned nodes.
+
+    Each function name is mapped to an integer id.
+    The node attributes `nest_level`, `src_line`,
+    and `file_name` (as an integer id of the file)
+    are stored in `array` columns indexed by node id.
+    Edges are stored in CSR form: the callees of node `i`
+    are `indices[indptr[i]:indptr[i + 1]]`.
+
+    Edges are added to a buffer, and moved to the CSR arrays
+    by `freeze`, which also removes duplicate edges.
+    Nodes are removed by marking them, so ids never change.
+
+    The class supports the part of the interface of
+    `networkx.DiGraph` that `pycflow2dot` uses:
+    `in`, `len`, iteration, `nodes`, `edges`,
+    `successors`, `predecessors`, `in_degree`, `has_edge`,
+    `remove_node`, and `remove_nodes_from`.
+    Node attributes are returned as new `dict`s,
+    so they are read-only. Edge attributes are stored
+    only for edges that have any.
+    """
+
+    def __init__(self):
+        self._names = list()
+        self._ids = dict()
+        self._nest_level = array('i')
+        self._src_line = array('l')
+        self._file_id = array('i')
+        self._file_names = list()
+        self._file_ids = dict()
+        self._alive = bytearray()
+        self._n_alive = 0
+        # edges added since `freeze`
+        self._new_tails = array('l')
+        self._new_heads = array('l')
+        self._indptr = array('l', [0])
+        self._indices = array('l')
+        # CSR of predecessors, built when needed
+        self._rev_indptr = None
+        self._rev_indices = None
+        # `indices` sorted within each row, for `has_edge`,
+        # built when needed
+        self._sorted_indices = None
+        self._edge_attr = dict()
+        self.graph = dict()
+        self.nodes = _NodeView(self)
+        self.edges = _EdgeView(self)
+
+    def __contains__(self, name):
+        i = self._ids.get(name)
+        return i is not None and self._alive[i] == 1
+
+    def __iter__(self):
+        alive = self._alive
+        for i, name in enumerate(self._names):
+            if alive[i]:
+                yield name
+
+    def __len__(self):
+        return self._n_alive
+
+    def add_node(self, name, nest_level, src_line, file_name=None):
+        """Return id of node `name`, adding it if new.
+
+        As in `cflow2nx`, the attributes of the first
+        occurrence are kept, except that a source line
+        and file name replace missing ones.
+
+        @rtype: `int`
+        """
+        i = self._ids.get(name)
+        if i is None:
+            i = len(self._names)
+            self._names.append(name)
+            self._ids[name] = i
+            self._nest_level.append(nest_level)
+            self._src_line.append(src_line)
+            self._file_id.append(self._intern_file(file_name))
+            self._alive.append(1)
+            self._n_alive += 1
+        elif src_line != -1 and self._src_line[i] == -1:
+            self._src_line[i] = src_line
+            self._file_id[i] = self._intern_file(file_name)
+        return i
+
+    def _intern_file(self, file_name):
+        """Return id of `file_name`, or `-1` if `None`."""
+        if file_name is None:
+            return -1
+        j = self._file_ids.get(file_name)
+        if j is None:
+            j = len(self._file_names)
+            self._file_names.append(file_name)
+            self._file_ids[file_name] = j
+        return j
+
+    def add_edge_ids(self, u, v):
+        """Add edge from node id `u` to node id `v`."""
+        self._new_tails.append(u)
+        self._new_heads.append(v)
+
+    def freeze(self):
+        """Move added edges to the CSR arrays.
+
+        Duplicate edges are removed, keeping the
+        order in which edges were first added.
+        """
+        n = len(self._names)
+        if not self._new_tails and len(self._indptr) == n + 1:
+            return
+        indptr = self._indptr
+        old_n = len(indptr) - 1
+        # all edges, grouped by tail with a counting sort
+        counts = array('l', [0]) * (n + 1)
+        for u in range(old_n):
+            counts[u + 1] += indptr[u + 1] - indptr[u]
+        for u in self._new_tails:
+            counts[u + 1] += 1
+        for u in range(n):
+            counts[u + 1] += counts[u]
+        heads = array('l', [0]) * counts[n]
+        pos = array('l', counts[:n])
+        for u in range(old_n):
+            for k in range(indptr[u], indptr[u + 1]):
+                heads[pos[u]] = self._indices[k]
+                pos[u] += 1
+        for u, v in zip(self._new_tails, self._new_heads):
+            heads[pos[u]] = v
+            pos[u] += 1
+        # remove duplicates
+        self._indptr = array('l', [0])
+        self._indices = array('l')
+        for u in range(n):
+            seen = set()
+            for k in range(counts[u], counts[u + 1]):
+                v = heads[k]
+                if v in seen:
+                    continue
+                seen.add(v)
+                self._indices.append(v)
+            self._indptr.append(len(self._indices))
+        self._new_tails = array('l')
+        self._new_heads = array('l')
+        self._rev_indptr = None
+        self._rev_indices = None
+        self._sorted_indices = None
+
+    def node_id(self, name):
+        """Return integer id of node `name`, or raise `KeyError`."""
+        i = self._ids.get(name)
+        if i is None or not self._alive[i]:
+            raise KeyError(name)
+        return i
+
+    def _node_attr(self, i):
+        """Return `dict` of attributes of node id `i`."""
+        d = dict(
+            nest_level=self._nest_level[i],
+            src_line=self._src_line[i])
+        j = self._file_id[i]
+        if j != -1:
+            d['file_name'] = self._file_names[j]
+        return d
+
+    def _successor_ids(self, i):
+        self.freeze()
+        alive = self._alive
+        indices = self._indices
+        for k in range(self._indptr[i], self._indptr[i + 1]):
+            v = indices[k]
+            if alive[v]:
+                yield v
+
+    def _predecessor_ids(self, i):
+        self.freeze()
+        if self._rev_indptr is None:
+            self._build_reverse()
+        alive = self._alive
+        indices = self._rev_indices
+        for k in range(self._rev_indptr[i], self._rev_indptr[i + 1]):
+            u = indices[k]
+            if alive[u]:
+                yield u
+
+    def _build_reverse(self):
+        """Build CSR of predecessors."""
+        n = len(self._names)
+        counts = array('l', [0]) * (n + 1)
+        for v in self._indices:
+            counts[v + 1] += 1
+        for v in range(n):
+            counts[v + 1] += counts[v]
+        tails = array('l', [0]) * counts[n]
+        pos = array('l', counts[:n])
+        for u in range(n):
+            for k in range(self._indptr[u], self._indptr[u + 1]):
+                v = self._indices[k]
+                tails[pos[v]] = u
+                pos[v] += 1
+        self._rev_indptr = counts
+        self._rev_indices = tails
+
+    def successors(self, name):
+        names = self._names
+        for v in self._successor_ids(self.node_id(name)):
+            yield names[v]
+
+    def predecessors(self, name):
+        names = self._names
+        for u in self._predecessor_ids(self.node_id(name)):
+            yield names[u]
+
+    def in_degree(self, name):
+        return sum(1 for _ in self._predecessor_ids(self.node_id(name)))
+
+    def has_edge(self, u, v):
+        if u not in self or v not in self:
+            return False
+        return self._has_edge_ids(self._ids[u], self._ids[v])
+
+    def _has_edge_ids(self, i, j):
+        """Return `True` if edge from id `i` to id `j` is stored.
+
+        Takes time logarithmic in the out-degree of `i`,
+        by bisecting the sorted row of `i`.
+        """
+        self.freeze()
+        if self._sorted_indices is None:
+            self._sort_indices()
+        lo = self._indptr[i]
+        hi = self._indptr[i + 1]
+        k = bisect_left(self._sorted_indices, j, lo, hi)
+        return k < hi and self._sorted_indices[k] == j
+
+    def _sort_indices(self):
+        """Build `indices` with each row sorted."""
+        indptr = self._indptr
+        indices = self._indices
+        sorted_indices = array('l')
+        for i in range(len(indptr) - 1):
+            sorted_indices.extend(sorted(indices[indptr[i]:indptr[i + 1]]))
+        self._sorted_indices = sorted_indices
+
+    def number_of_edges(self):
+        return sum(1 for _ in self.edges())
+
+    def remove_node(self, name):
+        i = self.node_id(name)
+        self._alive[i] = 0
+        self._n_alive -= 1
+
+    def remove_nodes_from(self, names):
+        for name in names:
+            if name in self:
+                self.remove_node(name)
+
+    def set_nest_levels(self, levels):
+        """Set attribute `nest_level` of nodes.
+
+        @param levels: maps node names to nest levels
+        @type levels: `dict`
+        """
+        for name, level in levels.items():
+            self._nest_level[self.node_id(name)] = level
+
+    def reverse(self):
+        """Return graph with the same nodes and reversed edges.
+
+        Node ids are preserved, and edge attributes copied.
+
+        @rtype: `CompactCallGraph`
+        """
+        g = self._copy_nodes()
+        if self._rev_indptr is None:
+            self._build_reverse()
+        g._indptr = array('l', self._rev_indptr)
+        g._indices = array('l', self._rev_indices)
+        g._edge_attr = {
+            (v, u): dict(d) for (u, v), d in self._edge_attr.items()}
+        return g
+
+    def subgraph(self, names):
+        """Return copy of the graph induced by nodes `names`.
+
+        Node ids are preserved, and edge attributes copied.
+
+        @type names: `set`
+        @rtype: `CompactCallGraph`
+        """
+        g = self._copy_nodes()
+        g._indptr = array('l', self._indptr)
+        g._indices = array('l', self._indices)
+        g._edge_attr = {
+            k: dict(d) for k, d in self._edge_attr.items()}
+        for i, name in enumerate(g._names):
+            if g._alive[i] and name not in names:
+                g._alive[i] = 0
+                g._n_alive -= 1
+        return g
+
+    def _copy_nodes(self):
+        """Return graph with copies of the nodes, without edges."""
+        self.freeze()
+        g = CompactCallGraph()
+        g._names = list(self._names)
+        g._ids = dict(self._ids)
+        g._nest_level = array('i', self._nest_level)
+        g._src_line = array('l', self._src_line)
+        g._file_id = array('i', self._file_id)
+        g._file_names = list(self._file_names)
+        g._file_ids = dict(self._file_ids)
+        g._alive = bytearray(self._alive)
+        g._n_alive = self._n_alive
+        g.graph = dict(self.graph)
+        return g
+
+    @classmethod
+    def from_networkx(cls, graph):
+        """Return `CompactCallGraph` with nodes and edges of `graph`."""
+        g = cls()
+        g.graph.update(graph.graph)
+        for u, d in graph.nodes(data=True):
+            g.add_node(
+                u, d['nest_level'], d['src_line'], d.get('file_name'))
+        for u, v, d in graph.edges(data=True):
+            g.add_edge_ids(g._ids[u], g._ids[v])
+            if d:
+                g._edge_attr[(g._ids[u], g._ids[v])] = dict(d)
+        g.freeze()
+        return g
+
+    def to_networkx(self):
+        """Return `networkx.DiGraph` with the same nodes and edges."""
+        g = nx.DiGraph()
+        g.graph.update(self.graph)
+        g.add_nodes_from(self.nodes(data=True))
+        g.add_edges_from(self.edges(data=True))
+        return g
+
+
+class _NodeView(object):
+    """Nodes of a `CompactCallGraph`, like `networkx.DiGraph.nodes`."""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __call__(self, data=False):
+        g = self._graph
+        if not data:
+            return iter(g)
+        return (
+            (name, g._node_attr(i))
+            for i, name in enumerate(g._names)
+            if g._alive[i])
+
+    def __getitem__(self, name):
+        g = self._graph
+        return g._node_attr(g.node_id(name))
+
+    def __iter__(self):
+        return iter(self._graph)
+
+    def __contains__(self, name):
+        return name in self._graph
+
+    def __len__(self):
+        return len(self._graph)
+
+
+class _EdgeView(object):
+    """Edges of a `CompactCallGraph`, like `networkx.DiGraph.edges`."""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __call__(self, data=False):
+        g = self._graph
+        names = g._names
+        for i, name in enumerate(names):
+            if not g._alive[i]:
+                continue
+            for j in g._successor_ids(i):
+                if data:
+                    d = g._edge_attr.get((i, j))
+                    if d is None:
+                        d = dict()
+                    yield (name, names[j], d)
+                else:
+                    yield (name, names[j])
+
+    def __iter__(self):
+        return self()
+
+    def __getitem__(self, edge):
+        """Return `dict` of attributes of `edge`, which can be changed."""
+        u, v = edge
+        g = self._graph
+        if not g.has_edge(u, v):
+            raise KeyError(edge)
+        return g._edge_attr.setdefault((g._ids[u], g._ids[v]), dict())
+
+
+def merge_graphs(graphs, c_fnames):
+    """Return union of `graphs`, as `_merge_graphs` does.
+
+    Nodes of functions defined in a file of `c_fnames`
+    are annotated with that file name.
+
+    @type graphs: `list` of `CompactCallGraph`
+    @type c_fnames: `list` of `str`
+    @rtype: `CompactCallGraph`
+    """
+    g = CompactCallGraph()
+    for graph, c_fname in zip(graphs, c_fnames):
+        g.graph.update(graph.graph)
+        # ids in `graph` -> ids in `g`
+        ids = array('l')
+        for i, name in enumerate(graph._names):
+            if not graph._alive[i]:
+                ids.append(-1)
+                continue
+            src_line = graph._src_line[i]
+            if src_line == -1:
+                file_name = None
+            else:
+                file_name = c_fname
+            ids.append(g.add_node(
+                name, graph._nest_level[i], src_line, file_name))
+        for i in range(len(graph._names)):
+            if not graph._alive[i]:
+                continue
+            for j in graph._successor_ids(i):
+                g.add_edge_ids(ids[i], ids[j])
+    g.freeze()
+    return g
@@ -19,12 +19,25 @@
 #
 from __future__ import absolute_import
 import argparse
+import bisect
+import codecs
+import collections
+import fnmatch
+import hashlib
+import itertools
+import json
 import locale
 import logging
+import math
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import os
 import re
+import shutil
 import subprocess
 import sys
+import tempfile
+import threading
 
 import networkx as nx
 try:
@@ -33,10 +46,43 @@ except:
     pydot = None
 
 from pycflow2dot import __version__ as _VERSION
-
-
+from pycflow2dot.compact import CompactCallGraph
+from pycflow2dot.compact import merge_graphs as _merge_compact_graphs
+
+
+# `--layout auto`: largest graphs, as `(nodes, edges)`,
+# laid out by `dot` with default and with fast attributes
+_AUTO_DOT_SIZE = (300, 1000)
+_AUTO_FAST_DOT_SIZE = (2000, 8000)
+# `--layout-cache`: largest graphs, as `(nodes, edges)`,
+# laid out by `neato` around pinned nodes,
+# because `neato` solves for all pairs of nodes
+_PINNED_NEATO_SIZE = (300, 1000)
+# points per inch, the unit of `pos` for `neato -n`
+_POINTS_PER_INCH = 72
+_IMG_FORMATS = ['dot', 'svg', 'pdf', 'png']
 _COLORS = ['#eecc80', '#ccee80', '#80ccee', '#eecc80', '#80eecc']
 _DOT_RESERVED = {'graph', 'strict', 'digraph', 'subgraph', 'node', 'edge'}
+# identifiers and numerals need no quotes in `dot`
+_DOT_ID = re.compile(r'(?:[^\W\d]\w*|-?(?:\.\d+|\d+(?:\.\d*)?))\Z')
+# line of `cflow -l` output, for example:
+# {   1}     foo() <void foo (int x) at foo.c:3>:
+# and with `--brief`, for functions already expanded:
+# {   3}         foo() <void foo (int x) at foo.c:3> [see 2]
+_CFLOW_LINE_PATTERN = (
+    r'\{\s*(\d+)\}\s*([^\s(]+)\('
+    r'(?:.*\sat\s(.*):(\d+)>)?(?:.*\[see (\d+)\])?')
+_CFLOW_LINE = re.compile(_CFLOW_LINE_PATTERN)
+_CFLOW_LINE_BYTES = re.compile(_CFLOW_LINE_PATTERN.encode('ascii'))
+# line of `cflow --xref` output, for a definition:
+# foo * foo.c:3 void foo (int x)
+# and for a reference:
+# foo   foo.c:12
+_XREF_LINE_PATTERN = r'(\S+)\s+(?:(\*)\s+)?(\S+):(\d+)'
+_XREF_LINE = re.compile(_XREF_LINE_PATTERN)
+_XREF_LINE_BYTES = re.compile(_XREF_LINE_PATTERN.encode('ascii'))
+# global flags at the start of a regular expression, like `(?i)`
+_REGEX_GLOBAL_FLAGS = re.compile(r'\(\?[aiLmsux]+\)')
 logger = logging.getLogger(__name__)
 
 
@@ -49,7 +95,470 @@ def call_cflow(
         c_fname, cflow,
         numbered_nesting=True,
         preprocess=False,
-        do_reverse=False):
+        do_reverse=False,
+        brief=False,
+        depth=None,
+        starts=None):
+    cflow_cmd = _cflow_command(
+        c_fname, cflow, numbered_nesting, preprocess, do_reverse, brief,
+        depth=depth, starts=starts)
+    logger.debug('cflow command:\n\t' + str(cflow_cmd))
+    cflow_data = subprocess.check_output(cflow_cmd)
+    cflow_data = bytes2str(cflow_data)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('cflow returned:\n\n' + cflow_data)
+    return cflow_data
+
+
+def stream_cflow(
+        c_fname, cflow,
+        numbered_nesting=True,
+        preprocess=False,
+        do_reverse=False,
+        decode=True,
+        brief=False,
+        depth=None,
+        starts=None):
+    """Yield lines of `cflow` output, while `cflow` runs.
+
+    The output is read from a pipe and decoded incrementally,
+    so it is never held in memory as a whole.
+    Pass the returned iterator to `cflow2nx`.
+
+    @param decode: if `False`, then yield the raw `bytes`,
+        leaving decoding of function names to `cflow2nx`
+    @param brief: if `True`, then pass `--brief` to `cflow`,
+        which expands each function only once
+    @param depth: as for `_cflow_command`
+    @param starts: as for `_cflow_command`
+    @rtype: generator of `str` or `bytes`
+    """
+    cflow_cmd = _cflow_command(
+        c_fname, cflow, numbered_nesting, preprocess, do_reverse, brief,
+        depth=depth, starts=starts)
+    return _stream_command(cflow_cmd, decode)
+
+
+def _stream_command(cflow_cmd, decode):
+    """Yield lines of output of `cflow_cmd`, while it runs."""
+    logger.debug('cflow command:\n\t' + str(cflow_cmd))
+    encoding = locale.getdefaultlocale()[1]
+    decoder = codecs.getincrementaldecoder(encoding)()
+    p = subprocess.Popen(cflow_cmd, stdout=subprocess.PIPE)
+    try:
+        for line in p.stdout:
+            if decode:
+                line = decoder.decode(line)
+            yield line
+        tail = decoder.decode(b'', final=True)
+        if decode and tail:
+            yield tail
+    finally:
+        p.stdout.close()
+        retcode = p.wait()
+    if retcode:
+        raise subprocess.CalledProcessError(retcode, cflow_cmd)
+
+
+def cflow_graphs(
+        c_fnames, cflow,
+        preprocess=False,
+        do_reverse=False,
+        jobs=1,
+        cache_dir=None,
+        brief=False,
+        xref=False,
+        compact=False,
+        exclude=None,
+        prune=False,
+        stop_at=None,
+        depth=None,
+        starts=None):
+    """Return graphs from calling `cflow` on each file.
+
+    Up to `jobs` files are processed concurrently,
+    each by a worker process that runs `cflow` and
+    parses its output, and sends the graph back pickled.
+    The parsing is in Python, so threads would
+    parse one file at a time, holding the GIL.
+    The graphs are returned in the order of `c_fnames`.
+
+    If `cache_dir` is given, then the output of `cflow`
+    is stored there, and reused while the C file,
+    the `cflow` version, and the options are unchanged.
+    The cache is not used when preprocessing,
+    because included headers are not tracked.
+
+    @param c_fnames: names of C files
+    @type c_fnames: `list` of `str`
+    @param jobs: number of concurrent `cflow` processes
+    @type jobs: `int` >= 1
+    @param cache_dir: directory of cached `cflow` output,
+        or `None` to always call `cflow`
+    @type cache_dir: `str` or `None`
+    @param brief: as for `stream_cflow`
+    @param xref: if `True`, then build graphs from
+        the cross-reference table of `cflow --xref`,
+        using `xref2nx`, instead of from the call tree
+    @param compact: if `True`, then return `CompactCallGraph`s
+    @param exclude: functions to omit while parsing,
+        as returned by `exclusion_matcher`
+    @param prune: as for `cflow2nx`
+    @param stop_at: as for `cflow2nx`
+    @param depth: largest nest level to plot, or `None`.
+        `cflow` is asked for one more level, so that
+        graphs with calls omitted are marked, as
+        described for `cflow2nx`.
+    @param starts: as for `_cflow_command`
+    @rtype: `list` of `networkx.DiGraph` or `CompactCallGraph`
+    """
+    if preprocess is not False and cache_dir is not None:
+        logger.info('Not caching `cflow` output when preprocessing.')
+        cache_dir = None
+    version = None
+    if cache_dir is not None:
+        _make_dirs(cache_dir)
+        version = _executable_id(cflow)
+    job_args = [
+        (c_fname, cflow, preprocess, do_reverse, brief, xref, compact,
+         exclude, prune, stop_at, depth, starts, cache_dir, version)
+        for c_fname in c_fnames]
+    return _map_jobs(_cflow_graph_job, job_args, jobs, processes=True)
+
+
+def _cflow_graph_job(job_args):
+    """Return graph of one file, for `cflow_graphs`.
+
+    At module level, so that worker processes can call it.
+    """
+    (c_fname, cflow, preprocess, do_reverse, brief, xref, compact,
+     exclude, prune, stop_at, depth, starts,
+     cache_dir, version) = job_args
+    cflow_cmd = _cflow_command(
+        c_fname, cflow, numbered_nesting=not xref,
+        preprocess=preprocess, do_reverse=do_reverse,
+        brief=brief, xref=xref,
+        depth=_cflow_depth(depth), starts=starts)
+    if cache_dir is None:
+        cflow_lines = _stream_command(cflow_cmd, decode=False)
+    else:
+        cflow_lines = _cached_cflow_lines(
+            cflow_cmd, [c_fname], cache_dir, version)
+    return _parse_cflow_output(
+        cflow_lines, c_fname, False, xref, compact,
+        exclude, prune, stop_at, depth)
+
+
+def _parse_cflow_output(
+        cflow_lines, c_fname, file_names, xref, compact,
+        exclude, prune, stop_at, max_depth):
+    """Return graph from `cflow` output, as selected."""
+    if xref:
+        g = xref2nx(
+            cflow_lines, c_fname, file_names=file_names,
+            exclude=exclude, stop_at=stop_at)
+        if compact:
+            g = CompactCallGraph.from_networkx(g)
+        return g
+    if compact:
+        parse = cflow2compact
+    else:
+        parse = cflow2nx
+    return parse(
+        cflow_lines, c_fname, file_names=file_names,
+        exclude=exclude, prune=prune, stop_at=stop_at,
+        max_depth=max_depth)
+
+
+def _cflow_depth(depth):
+    """Return `--depth` for `cflow` that shows if `depth` truncates.
+
+    `cflow` is asked for levels beyond `depth`,
+    so that lines deeper than `depth` appear
+    if, and only if, calls are omitted.
+    """
+    if depth is None:
+        return None
+    return depth + 2
+
+
+def whole_program_graph(
+        c_fnames, cflow,
+        preprocess=False,
+        do_reverse=False,
+        cache_dir=None,
+        brief=False,
+        xref=False,
+        compact=False,
+        exclude=None,
+        prune=False,
+        stop_at=None,
+        depth=None,
+        starts=None):
+    """Return graph from calling `cflow` once on all files.
+
+    `cflow` resolves calls across the files, and
+    each definition is attributed to its file from
+    the output of `cflow`. The graph is as returned
+    by `_merge_graphs`. For a graph per file, pass it
+    to `split_by_file`.
+
+    The arguments are as for `cflow_graphs`.
+
+    @rtype: `networkx.DiGraph` or `CompactCallGraph`
+    """
+    if preprocess is not False and cache_dir is not None:
+        logger.info('Not caching `cflow` output when preprocessing.')
+        cache_dir = None
+    cflow_cmd = _cflow_command(
+        list(c_fnames), cflow, numbered_nesting=not xref,
+        preprocess=preprocess, do_reverse=do_reverse,
+        brief=brief, xref=xref,
+        depth=_cflow_depth(depth), starts=starts)
+    if cache_dir is None:
+        cflow_lines = _stream_command(cflow_cmd, decode=False)
+    else:
+        _make_dirs(cache_dir)
+        version = _executable_id(cflow)
+        cflow_lines = _cached_cflow_lines(
+            cflow_cmd, c_fnames, cache_dir, version)
+    return _parse_cflow_output(
+        cflow_lines, None, True, xref, compact,
+        exclude, prune, stop_at, depth)
+
+
+def split_by_file(graph, c_fnames):
+    """Return a graph for each file, as `cflow_graphs` does.
+
+    The graph of a file contains the functions defined
+    in that file, and the functions that they call.
+    Functions defined in other files have `src_line`
+    equal to `-1`. Nest levels are recomputed within
+    each graph, by `_assign_nest_levels`.
+
+    @param graph: as returned by `whole_program_graph`
+    @type c_fnames: `list` of `str`
+    @rtype: `list` of `networkx.DiGraph`
+    """
+    defined = collections.defaultdict(list)
+    order = dict()
+    for i, (u, d) in enumerate(graph.nodes(data=True)):
+        order[u] = i
+        c_fname = d.get('file_name')
+        if c_fname is not None:
+            defined[c_fname].append(u)
+    graphs = list()
+    for c_fname in c_fnames:
+        here = set(defined[c_fname])
+        nodes = set(here)
+        for u in here:
+            nodes.update(graph.successors(u))
+        g = nx.DiGraph()
+        g.graph.update(graph.graph)
+        # in the order of `graph`
+        for u in sorted(nodes, key=order.get):
+            if u in here:
+                src_line = graph.nodes[u]['src_line']
+            else:
+                src_line = -1
+            g.add_node(u, src_line=src_line)
+        for u in defined[c_fname]:
+            for v in graph.successors(u):
+                g.add_edge(u, v)
+        roots = [u for u in g if g.in_degree(u) == 0]
+        _assign_nest_levels(g, roots)
+        graphs.append(g)
+    return graphs
+
+
+def _executable_id(path):
+    """Return `str` that changes when executable `path` changes.
+
+    Used in place of the version, to avoid starting a process.
+    """
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return '{path}:{size}:{mtime}'.format(
+        path=path, size=stat.st_size, mtime=stat.st_mtime)
+
+
+def _cached_cflow_lines(cflow_cmd, c_fnames, cache_dir, version):
+    """Return iterator of lines of `cflow` output, as `bytes`.
+
+    If the output is in `cache_dir`, then it is read from there.
+    Otherwise, `cflow_cmd` is run, and its output copied to
+    `cache_dir` as the lines are yielded.
+
+    The cached file is opened here, so that once found,
+    it is read even if another run evicts it meanwhile.
+    """
+    key = _cflow_cache_key(cflow_cmd, c_fnames, version)
+    path = os.path.join(cache_dir, key)
+    try:
+        f = open(path, 'rb')
+    except (IOError, OSError):
+        # not cached, or evicted by another run
+        f = None
+    if f is not None:
+        _touch_cached(path)
+        logger.info('Using cached `cflow` output for: {f}'.format(
+            f=', '.join(c_fnames)))
+        return _read_lines(f)
+    cflow_lines = _stream_command(cflow_cmd, decode=False)
+    return _tee_lines(cflow_lines, path)
+
+
+def _cflow_cache_key(cflow_cmd, c_fnames, version):
+    """Return hash of `cflow` call and contents of `c_fnames`."""
+    h = hashlib.sha256()
+    for s in [version] + cflow_cmd[1:]:
+        h.update(s.encode('utf-8'))
+        h.update(b'\0')
+    for c_fname in c_fnames:
+        with open(c_fname, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                h.update(chunk)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _touch_cached(path):
+    """Return `True` if `path` exists, marking it as recently used.
+
+    The modification time records use, for LRU eviction.
+    """
+    try:
+        os.utime(path, None)
+    except OSError:
+        return False
+    return True
+
+
+def _read_lines(f):
+    """Yield lines of binary file object `f`, and close it."""
+    with f:
+        for line in f:
+            yield line
+
+
+def _tee_lines(lines, path):
+    """Yield `lines`, and write them to file `path`.
+
+    The file appears only after all `lines` are written,
+    so interrupted runs leave no partial entries.
+    """
+    cache_dir = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for line in lines:
+                f.write(line)
+                yield line
+        _replace_file(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _replace_file(src, dst):
+    """Rename `src` to `dst`, overwriting `dst`."""
+    try:
+        os.rename(src, dst)
+    except OSError:
+        # Windows refuses to overwrite
+        os.remove(dst)
+        os.rename(src, dst)
+
+
+def _make_dirs(path):
+    """Create directory `path` and its parents, if missing."""
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+
+def evict_cache(cache_dir, max_size):
+    """Delete least recently used files until `cache_dir` fits.
+
+    Other runs may share `cache_dir`, and evict
+    the same files meanwhile, which is ignored.
+
+    @param max_size: maximum total size of cached files, in bytes
+    @type max_size: `int`
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    entries = list()
+    total = 0
+    for name in os.listdir(cache_dir):
+        # skip files being written
+        if name.startswith('.'):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # evicted by another run
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            # evicted by another run, or open on Windows
+            pass
+        total -= size
+        logger.info('Evicted from cache: ' + path)
+
+
+def _default_cache_dir():
+    """Return directory for caching, following XDG conventions."""
+    cache_home = os.environ.get('XDG_CACHE_HOME')
+    if not cache_home:
+        cache_home = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'pycflow2dot')
+
+
+def _map_jobs(func, items, jobs, processes=False):
+    """Return `list` of results of `func` for each of `items`.
+
+    Up to `jobs` calls run concurrently, and the results
+    are in the order of `items`.
+
+    @param processes: if `True`, then call `func` in
+        worker processes, for work done in Python.
+        Then `func`, `items`, and the results are pickled.
+        Otherwise threads, for waiting on subprocesses.
+    """
+    items = list(items)
+    jobs = min(jobs, len(items))
+    if jobs <= 1:
+        return [func(item) for item in items]
+    if processes:
+        pool = multiprocessing.Pool(jobs)
+    else:
+        pool = ThreadPool(jobs)
+    try:
+        return pool.map(func, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _cflow_command(
+        c_fname, cflow, numbered_nesting, preprocess, do_reverse,
+        brief=False, xref=False, depth=None, starts=None):
+    """Return `list` of arguments for calling `cflow`.
+
+    @param depth: passed to `cflow` as `--depth`,
+        to cut off the tree there, unless `None`
+    @param starts: names of functions to start the tree from,
+        each passed to `cflow` as `--main`
+    @type starts: `list` of `str` or `None`
+    """
     cflow_cmd = [cflow]
     if numbered_nesting:
         cflow_cmd.append('-l')
@@ -60,84 +569,521 @@ def call_cflow(
         cflow_cmd.append('--cpp=' + preprocess)
     if do_reverse:
         cflow_cmd.append('--reverse')
-    cflow_cmd.append(c_fname)
-    logger.debug('cflow command:\n\t' + str(cflow_cmd))
-    cflow_data = subprocess.check_output(cflow_cmd)
-    cflow_data = bytes2str(cflow_data)
-    logger.debug('cflow returned:\n\n' + cflow_data)
-    return cflow_data
+    if brief:
+        cflow_cmd.append('--brief')
+    if xref:
+        cflow_cmd.append('--xref')
+    if depth is not None:
+        cflow_cmd.append('--depth={depth}'.format(depth=depth))
+    if starts:
+        cflow_cmd.extend('--main=' + start for start in starts)
+    # all files of a program ?
+    if isinstance(c_fname, list):
+        cflow_cmd.extend(c_fname)
+    else:
+        cflow_cmd.append(c_fname)
+    return cflow_cmd
 
 
-def cflow2nx(cflow_str, c_fname):
+def cflow2nx(
+        cflow_str, c_fname, file_names=False,
+        exclude=None, prune=False, stop_at=None, max_depth=None):
     """Return graph from output of `cflow`.
 
-    @param cflow_str: output of `cflow`
-    @type cflow_str: `str`
+    Output of `cflow --brief` is parsed too, so that the
+    graph is built from input linear in the number of
+    call sites, and is the same as without `--brief`.
+
+    @param cflow_str: output of `cflow`, either as
+        a whole or as an iterable of lines
+        (for example from `stream_cflow`),
+        decoded or as raw `bytes`
+    @type cflow_str: `str` or iterable of `str` or `bytes`
     @param c_fname: name of C file
     @type c_fname: `str`
+    @param file_names: if `True`, then add the attribute
+        `file_name` to nodes of functions defined in
+        the files parsed, as `_merge_graphs` does.
+        Used when `cflow` parsed several files.
+    @param exclude: functions to omit, as returned by
+        `exclusion_matcher`. Nodes are not created for
+        excluded functions, and their callees become roots.
+    @param prune: if `True`, then also skip the lines
+        nested under excluded functions, without matching
+        them.
+    @param stop_at: functions whose callees to omit,
+        as returned by `exclusion_matcher`. Nodes are
+        created for these functions, and the lines nested
+        under them are skipped, as for `prune`.
+    @param max_depth: largest nest level to keep, or `None`
+
+    Skipping lines with `prune`, `stop_at`, or `max_depth`
+    is incorrect for output of `cflow --brief`,
+    because a function expanded only under skipped lines
+    loses its callees, where `[see N]` refers to it.
     @return: graph of nodes named after functions,
         with attributes:
         - `nest_level`: distance of call from root
         - `src_line`: source line number or
             `-1` if function is defined in another file
+
+        If lines deeper than `max_depth` were skipped,
+        then the graph attribute `truncated_at`
+        equals `max_depth`.
     @rtype: `networkx.DiGraph`
     """
-    lines = cflow_str.replace('\r', '').split('\n')
     g = nx.DiGraph()
+    verbose = logger.isEnabledFor(logging.INFO)
+    calls = _iter_cflow_tree(
+        cflow_str, exclude, prune, stop_at, max_depth, g.graph)
+    for call in calls:
+        cur_node, nest_level, src_file, src_line_no, pred_node = call
+        # not already seen ?
+        if cur_node not in g:
+            g.add_node(cur_node, nest_level=nest_level, src_line=src_line_no)
+            if file_names and src_file is not None:
+                g.nodes[cur_node]['file_name'] = src_file
+            if verbose:
+                logger.info('New Node: ' + cur_node)
+        elif src_line_no != -1 and g.nodes[cur_node]['src_line'] == -1:
+            # first seen where not expanded
+            g.nodes[cur_node]['src_line'] = src_line_no
+            if file_names and src_file is not None:
+                g.nodes[cur_node]['file_name'] = src_file
+        # root node ?
+        if pred_node is None:
+            continue
+        # new edge ?
+        if g.has_edge(pred_node, cur_node):
+            # avoid duplicate edges
+            # note DiGraph is so def
+
+            # buggy: coloring depends on first occurrence ! (subjective)
+            continue
+        # add new edge
+        g.add_edge(pred_node, cur_node)
+        if verbose:
+            logger.info(
+                'Found edge:\n\t{pred_node}--->{cur_node}'.format(
+                    pred_node=pred_node, cur_node=cur_node))
+    return g
+
+
+def cflow2compact(
+        cflow_str, c_fname, file_names=False,
+        exclude=None, prune=False, stop_at=None, max_depth=None):
+    """Return compact graph from output of `cflow`.
+
+    Same as `cflow2nx`, but returns the integer-interned
+    representation `CompactCallGraph`, which is built
+    without a `dict` per node or edge.
+
+    @rtype: `CompactCallGraph`
+    """
+    g = CompactCallGraph()
+    calls = _iter_cflow_tree(
+        cflow_str, exclude, prune, stop_at, max_depth, g.graph)
+    for call in calls:
+        cur_node, nest_level, src_file, src_line_no, pred_node = call
+        if not file_names:
+            src_file = None
+        i = g.add_node(cur_node, nest_level, src_line_no, src_file)
+        if pred_node is not None:
+            # duplicates are removed when `g` is frozen
+            g.add_edge_ids(g.node_id(pred_node), i)
+    g.freeze()
+    return g
+
+
+def _iter_cflow_tree(
+        cflow_str, exclude=None, prune=False, stop_at=None,
+        max_depth=None, graph_attr=None):
+    """Yield each call in the tree printed by `cflow`.
+
+    @param cflow_str: as for `cflow2nx`
+    @param exclude: as for `cflow2nx`.
+        Excluded functions are not yielded, and
+        functions that they call are yielded as roots.
+    @param prune: as for `cflow2nx`
+    @param stop_at: as for `cflow2nx`
+    @param max_depth: as for `cflow2nx`
+    @param graph_attr: where `truncated_at` is set,
+        if lines deeper than `max_depth` are skipped
+    @type graph_attr: `dict`
+    @return: `(func_name, nest_level, src_file, src_line, caller)`
+        for each line, where `caller` is `None` for roots,
+        and names are renamed by `rename_if_reserved_by_dot`
+    @rtype: generator of `tuple`
+    """
+    if hasattr(cflow_str, 'splitlines'):
+        lines = cflow_str.splitlines()
+    else:
+        lines = cflow_str
     stack = dict()
+    debug = logger.isEnabledFor(logging.DEBUG)
+    # lines nested deeper than this are skipped
+    skip_below = None
     for line in lines:
-        # logger.debug(line)
-        # empty line ?
-        if not line:
+        if skip_below is not None:
+            nest_level = _nest_level_of(line)
+            if nest_level is None or nest_level > skip_below:
+                continue
+            skip_below = None
+        if max_depth is not None:
+            nest_level = _nest_level_of(line)
+            if nest_level is not None and nest_level > max_depth:
+                if graph_attr is not None:
+                    graph_attr['truncated_at'] = max_depth
+                continue
+        tokens = _tokenize_cflow_line(line)
+        if tokens is None:
+            if line.strip():
+                logger.warning(
+                    'Skipping unparsable line of cflow output:\n\t'
+                    '{line!r}'.format(line=line))
             continue
-        # defined in this file ?
-        # apparently, this check is not needed: check this better
-        #
-        # get source line #
-        src_line_no = re.findall(':.*>', line)
-        if src_line_no:
-            src_line_no = int(src_line_no[0][1:-1])
-        else:
-            src_line_no = -1
-        # trim
-        s = re.sub(r'\(.*$', '', line)
-        s = re.sub(r'^\{\s*', '', s)
-        s = re.sub(r'\}\s*', r'\t', s)
-        # where are we ?
-        (nest_level, func_name) = re.split(r'\t', s)
-        nest_level = int(nest_level)
+        nest_level, func_name, src_file, src_line_no, see = tokens
         cur_node = rename_if_reserved_by_dot(func_name)
-        logger.debug((
-            'Found function:\n\t{func_name}'
-            ',\n at depth:\n\t{nest_level}'
-            ',\n at src line:\n\t{src_line_no}').format(
-                func_name=func_name,
-                nest_level=nest_level,
-                src_line_no=src_line_no))
+        if debug:
+            logger.debug((
+                'Found function:\n\t{func_name}'
+                ',\n at depth:\n\t{nest_level}'
+                ',\n at src line:\n\t{src_line_no}').format(
+                    func_name=func_name,
+                    nest_level=nest_level,
+                    src_line_no=src_line_no))
+        if exclude is not None and exclude(cur_node, src_line_no):
+            stack[nest_level] = None
+            if prune:
+                skip_below = nest_level
+            continue
+        # with `--brief`, a back-reference `[see N]` is a leaf,
+        # because its callees are nested below line `N`,
+        # which were yielded then
         stack[nest_level] = cur_node
-        # not already seen ?
-        if cur_node not in g:
-            g.add_node(cur_node, nest_level=nest_level, src_line=src_line_no)
-            logger.info('New Node: ' + cur_node)
         # not root node ?
         if nest_level != 0:
-            # then has predecessor
+            # then has predecessor, unless excluded
             pred_node = stack[nest_level - 1]
-            # new edge ?
-            if g.has_edge(pred_node, cur_node):
-                # avoid duplicate edges
-                # note DiGraph is so def
+        else:
+            pred_node = None
+        if stop_at is not None and stop_at(cur_node, src_line_no):
+            skip_below = nest_level
+        yield (cur_node, nest_level, src_file, src_line_no, pred_node)
 
-                # buggy: coloring depends on first occurrence ! (subjective)
-                continue
-            # add new edge
-            g.add_edge(pred_node, cur_node)
-            logger.info(
-                'Found edge:\n\t{pred_node}--->{cur_node}'.format(
-                    pred_node=pred_node, cur_node=cur_node))
+
+def _nest_level_of(line):
+    """Return nest level of a line of `cflow -l` output.
+
+    Only the number in braces is read, which is
+    cheaper than `_tokenize_cflow_line`.
+
+    @type line: `str` or `bytes`
+    @return: nest level, or `None` if `line`
+        is not part of the call tree
+    @rtype: `int` or `None`
+    """
+    if isinstance(line, bytes):
+        end = line.find(b'}')
+    else:
+        end = line.find('}')
+    if end == -1:
+        return None
+    try:
+        return int(line[1:end])
+    except ValueError:
+        return None
+
+
+def _tokenize_cflow_line(line):
+    """Return nest level, function name, source, and reference.
+
+    The line is matched in a single pass.
+    The source file is `None` and the source line `-1`
+    if the function is not defined in the files
+    that `cflow` parsed.
+    The reference is the number of the output line
+    where `cflow --brief` expanded the function before,
+    or `None` if the function is expanded here.
+
+    @param line: line of output from `cflow -l`
+    @type line: `str` or `bytes`
+    @return: `(nest_level, func_name, src_file, src_line, see)`,
+        or `None` if `line` is not part of the call tree
+    @rtype: `tuple` of `int`, `str`, `str` or `None`,
+        `int`, `int` or `None`
+    """
+    if isinstance(line, bytes):
+        match = _CFLOW_LINE_BYTES.match(line)
+    else:
+        match = _CFLOW_LINE.match(line)
+    if match is None:
+        return None
+    nest_level, func_name, src_file, src_line, see = match.groups()
+    if isinstance(func_name, bytes):
+        # C identifiers are ASCII, or UTF-8 if extended
+        func_name = func_name.decode('utf-8', 'replace')
+        if src_file is not None:
+            src_file = src_file.decode('utf-8', 'replace')
+    if src_line is None:
+        src_line = -1
+    else:
+        src_line = int(src_line)
+    if see is not None:
+        see = int(see)
+    return (int(nest_level), func_name, src_file, src_line, see)
+
+
+def xref2nx(
+        xref_str, c_fname, file_names=False, exclude=None, stop_at=None):
+    """Return graph from output of `cflow --xref`.
+
+    The cross-reference table lists where each function
+    is defined and referenced, without repeating subtrees.
+    Each reference is attributed to the caller defined
+    last before it in the same file. This approximates
+    the call tree: declarations between definitions
+    are attributed to the preceding function too.
+
+    As `cflow` does for the tree, if `main` is defined,
+    then only functions reachable from `main` are kept.
+    The nest levels are computed by `_assign_nest_levels`.
+
+    @param xref_str: output of `cflow --xref`,
+        as for `cflow2nx`
+    @param c_fname: name of C file
+    @type c_fname: `str`
+    @param file_names: as for `cflow2nx`
+    @param exclude: as for `cflow2nx`. Excluded functions
+        are removed after the table is read, because
+        whether a function is defined in the files parsed
+        is known only then.
+    @param stop_at: as for `cflow2nx`. References from these
+        functions are ignored, so their callees are omitted
+        if `main` is defined and they are reachable
+        only through them.
+    @return: graph as returned by `cflow2nx`
+    @rtype: `networkx.DiGraph`
+    """
+    if hasattr(xref_str, 'splitlines'):
+        lines = xref_str.splitlines()
+    else:
+        lines = xref_str
+    g = nx.DiGraph()
+    # (file, line, function) of each definition
+    definitions = list()
+    # (file, line, function) of each reference
+    references = list()
+    for line in lines:
+        if isinstance(line, bytes):
+            match = _XREF_LINE_BYTES.match(line)
+        else:
+            match = _XREF_LINE.match(line)
+        if match is None:
+            if line.strip():
+                logger.warning(
+                    'Skipping unparsable line of cflow output:\n\t'
+                    '{line!r}'.format(line=line))
+            continue
+        func_name, star, fname, src_line = match.groups()
+        if isinstance(func_name, bytes):
+            func_name = func_name.decode('utf-8', 'replace')
+        node = rename_if_reserved_by_dot(func_name)
+        item = (fname, int(src_line), node)
+        if star:
+            definitions.append(item)
+            g.add_node(node, src_line=int(src_line))
+            if file_names:
+                if isinstance(fname, bytes):
+                    fname = fname.decode('utf-8', 'replace')
+                g.nodes[node]['file_name'] = fname
+        else:
+            references.append(item)
+            if node not in g:
+                g.add_node(node, src_line=-1)
+    # attribute references to callers
+    definitions.sort()
+    keys = [(fname, src_line) for fname, src_line, _ in definitions]
+    for fname, src_line, node in references:
+        i = bisect.bisect_right(keys, (fname, src_line))
+        if i == 0:
+            continue
+        def_fname, _, caller = definitions[i - 1]
+        if def_fname != fname:
+            continue
+        if stop_at is not None and stop_at(
+                caller, g.nodes[caller]['src_line']):
+            continue
+        g.add_edge(caller, node)
+    if 'main' in g and g.nodes['main']['src_line'] != -1:
+        roots = ['main']
+        reachable = nx.descendants(g, 'main')
+        reachable.add('main')
+        g.remove_nodes_from([u for u in g if u not in reachable])
+    else:
+        roots = [u for u in g if g.in_degree(u) == 0]
+    if exclude is not None:
+        g.remove_nodes_from([
+            u for u, d in g.nodes(data=True)
+            if exclude(u, d['src_line'])])
+        roots = [u for u in roots if u in g]
+    _assign_nest_levels(g, roots)
+    return g
+
+
+def exclusion_matcher(patterns, externals=False):
+    """Return function that tells which functions match `patterns`.
+
+    Used for the functions to exclude, and those to stop at.
+
+    Each pattern is either:
+      - a function name
+      - a glob, if it contains any of `*?[`, as for `fnmatch`
+      - a regular expression, if prefixed with `re:`,
+        which has to match the whole name
+
+    Names are looked up in a `set`. The globs are compiled
+    into a single regular expression, so each function
+    is matched against them once. Each regular expression
+    is compiled alone, so that it can set global flags,
+    as `re:(?i)log.*` does, and name groups freely.
+
+    @param patterns: as read by `read_exclusion_patterns`
+    @type patterns: iterable of `str`
+    @param externals: if `True`, then also exclude functions
+        not defined in the files parsed (`src_line == -1`).
+        When each file is parsed alone, a function defined
+        in another input file looks external, so use
+        `rm_external_funcs` after parsing instead.
+    @return: `exclude(func_name, src_line)`, which returns
+        `True` if the function is excluded, or `None` if
+        nothing is excluded
+    @rtype: `_FunctionMatcher` or `None`
+    @raise ValueError: if a regular expression is invalid
+    """
+    names = set()
+    globs = list()
+    regexes = list()
+    for pattern in patterns:
+        if pattern.startswith('re:'):
+            regexes.append(_compile_whole_name_regex(pattern))
+        elif any(c in pattern for c in '*?['):
+            globs.append(fnmatch.translate(pattern))
+        else:
+            names.add(pattern)
+    if globs:
+        regexes.insert(0, re.compile('|'.join(globs)))
+    if not names and not regexes and not externals:
+        return None
+    return _FunctionMatcher(names, regexes, externals)
+
+
+def _compile_whole_name_regex(pattern):
+    """Return regular expression of `re:` `pattern` for whole names.
+
+    Global flags at the start of `pattern`
+    are kept at the start of the result.
+
+    @raise ValueError: if `pattern` is invalid
+    """
+    regex = pattern[3:]
+    match = _REGEX_GLOBAL_FLAGS.match(regex)
+    if match is None:
+        flags = ''
+    else:
+        flags = match.group()
+        regex = regex[len(flags):]
+    try:
+        return re.compile('{flags}(?:{regex})\\Z'.format(
+            flags=flags, regex=regex))
+    except re.error as e:
+        raise ValueError(
+            'invalid pattern `{pattern}`: {e}'.format(
+                pattern=pattern, e=e))
+
+
+class _FunctionMatcher(object):
+    """Callable returned by `exclusion_matcher`.
+
+    A class instead of a closure, so that it can be
+    pickled, and passed to the processes of `cflow_graphs`.
+    """
+
+    def __init__(self, names, regexes, externals):
+        self.names = names
+        self.regexes = regexes
+        self.externals = externals
+
+    def __call__(self, func_name, src_line):
+        if self.externals and src_line == -1:
+            return True
+        if func_name in self.names:
+            return True
+        return any(
+            regex.match(func_name) is not None
+            for regex in self.regexes)
+
+
+def read_exclusion_patterns(list_fname):
+    """Return patterns listed in file, one per line.
+
+    Blank lines and lines that start with `#` are ignored.
+
+    @type list_fname: `str`
+    @rtype: `list` of `str`
+    """
+    with open(list_fname) as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def reverse_graph(graph):
+    """Return callee-caller graph of `graph`.
+
+    This is the graph that `cflow --reverse` would produce,
+    without calling `cflow` again. The nest level of each node
+    is recomputed as its distance from the functions that
+    call no others, which are the roots of the reverse graph.
+
+    @type graph: `networkx.DiGraph` or `CompactCallGraph`
+    @rtype: same as `graph`
+    """
+    if isinstance(graph, CompactCallGraph):
+        g = graph.reverse()
+    else:
+        g = graph.reverse(copy=True)
+    roots = [u for u in g if g.in_degree(u) == 0]
+    _assign_nest_levels(g, roots)
     return g
 
 
+def _assign_nest_levels(g, roots):
+    """Set node attribute `nest_level` by breadth-first search.
+
+    The nest level is the distance from the nearest of `roots`.
+    Nodes not reachable from `roots`, which are on cycles,
+    are searched from in turn, each as a root.
+    """
+    levels = dict()
+    for root in itertools.chain(roots, g):
+        if root in levels:
+            continue
+        levels[root] = 0
+        queue = collections.deque([root])
+        while queue:
+            u = queue.popleft()
+            level = levels[u] + 1
+            for v in g.successors(u):
+                if v in levels:
+                    continue
+                levels[v] = level
+                queue.append(v)
+    if isinstance(g, CompactCallGraph):
+        g.set_nest_levels(levels)
+    else:
+        nx.set_node_attributes(g, levels, 'nest_level')
+
+
 def rename_if_reserved_by_dot(word):
     # dot is case-insensitive, according to:
     #   http://www.graphviz.org/doc/info/lang.html
@@ -146,21 +1092,187 @@ def rename_if_reserved_by_dot(word):
     return word
 
 
-def dot_preamble(c_fname, for_latex, rankdir):
-    c_fname = _graph_name_for_latex(c_fname, for_latex)
-    d = _graph_node_defaults()
-    node_defaults = ', '.join(
-        '{k}={v}'.format(k=k, v=v) for k, v in d.items())
-    dot_str = (
-        'digraph G {{\n'
-        'node [{node_defaults}];\n'
-        'rankdir={rankdir};\n'
-        'label="{c_fname}"\n'
-        ).format(
-            node_defaults=node_defaults,
-            rankdir=rankdir,
-            c_fname=c_fname)
-    return dot_str
+def dot_preamble(
+        c_fname, for_latex, rankdir, layout='dot', size=None,
+        pinned=None):
+    """Return start of `dot` code, up to the node statements.
+
+    @param c_fname: graph label, or `None` for no label
+    @param size: as for `_layout_attr`
+    @param pinned: engine that replaces the one of `layout`,
+        as returned by `pinned_engine`, or `None`
+    @type pinned: `str` or `None`
+    """
+    attr = list()
+    if c_fname is not None:
+        label = _graph_name_for_latex(c_fname, for_latex)
+        attr.append(('label', label))
+    layout_attr = _layout_attr(layout, rankdir, size)
+    if pinned is not None:
+        layout_attr = [(k, v) for k, v in layout_attr if k != 'layout']
+        layout_attr.insert(0, ('layout', pinned))
+    if pinned == 'nop2':
+        layout_attr.append(('inputscale', str(_POINTS_PER_INCH)))
+    attr.extend(layout_attr)
+    lines = ['digraph G {\n']
+    lines.extend(
+        '{k}={v};\n'.format(k=k, v=_dot_quote(v))
+        for k, v in attr)
+    node_defaults = _format_dot_attr(_graph_node_defaults())
+    lines.append('node [{d}];\n'.format(d=node_defaults))
+    return ''.join(lines)
+
+
+def _layout_attr(layout, rankdir, size=None):
+    """Return `list` of graph attributes for `layout`.
+
+    For `layout == 'auto'`, the engine is chosen by
+    `choose_layout`, and given as attribute `layout`,
+    which Graphviz reads whichever program renders.
+
+    @param size: number of nodes and edges,
+        required if `layout == 'auto'`
+    @type size: `tuple` of `int`
+    """
+    if layout == 'auto':
+        engine, fast_attr = choose_layout(*size)
+        attr = [('layout', engine)]
+        attr.extend(_layout_attr(engine, rankdir))
+        fast_attr = dict(fast_attr)
+        attr = [(k, fast_attr.pop(k, v)) for k, v in attr]
+        attr.extend(sorted(fast_attr.items()))
+        return attr
+    attr = [('splines', 'true')]
+    if layout == 'twopi':
+        attr.append(('ranksep', '5'))
+        attr.append(('root', 'main'))
+    else:
+        attr.append(('overlap', 'false'))
+        attr.append(('rankdir', rankdir))
+    return attr
+
+
+def choose_layout(n_nodes, n_edges):
+    """Return layout engine and attributes for a graph of this size.
+
+    Small graphs are laid out by `dot`. Larger graphs are
+    laid out by `dot` with fewer iterations of network simplex
+    (`nslimit`, `nslimit1`) and crossing minimization
+    (`mclimit`, `searchsize`), polyline edges, and
+    parallel edges merged if the graph is dense.
+    The largest graphs are laid out by `sfdp`,
+    which is near-linear, with straight edges.
+
+    @return: `(engine, attr)`, where `attr` is
+        a `list` of `(name, value)` graph attributes
+    @rtype: `tuple`
+    """
+    max_nodes, max_edges = _AUTO_DOT_SIZE
+    if n_nodes <= max_nodes and n_edges <= max_edges:
+        return ('dot', list())
+    max_nodes, max_edges = _AUTO_FAST_DOT_SIZE
+    if n_nodes <= max_nodes and n_edges <= max_edges:
+        attr = [
+            ('nslimit', '2'),
+            ('nslimit1', '2'),
+            ('mclimit', '0.5'),
+            ('searchsize', '10'),
+            ('splines', 'polyline')]
+        if n_edges > 2 * n_nodes:
+            attr.append(('concentrate', 'true'))
+        return ('dot', attr)
+    return ('sfdp', [('splines', 'line')])
+
+
+def estimate_render_time(engine, n_nodes, n_edges, fast=False):
+    """Return rough estimate of seconds that Graphviz takes.
+
+    The estimate grows superlinearly for `dot`,
+    and as `(n + m) log(n + m)` for `sfdp`.
+    It is meant for telling seconds from hours.
+
+    @param fast: if `True`, then `dot` is run
+        with the attributes from `choose_layout`
+    @rtype: `float`
+    """
+    n = n_nodes + n_edges
+    if engine == 'dot':
+        t = n ** 1.5 / 1e5
+        if fast:
+            t /= 4
+        return t
+    return n * math.log(n + 2, 2) / 2e5
+
+
+def _print_layout_estimate(layout, graph, img_fname):
+    """Print engine that `layout='auto'` chooses, and its cost."""
+    if layout != 'auto':
+        return
+    n_nodes, n_edges = _graph_size(graph)
+    engine, attr = choose_layout(n_nodes, n_edges)
+    t = estimate_render_time(engine, n_nodes, n_edges, fast=bool(attr))
+    print((
+        '{img_fname}: {n} nodes, {m} edges, laid out with {engine}, '
+        'estimated to take {t:.1f} s').format(
+            img_fname=img_fname, n=n_nodes, m=n_edges,
+            engine=engine, t=t))
+
+
+def _graph_size(graph):
+    """Return numbers of nodes and edges of `graph`."""
+    return (len(graph), graph.number_of_edges())
+
+
+def _dot_quote(s):
+    """Return `s` as a `dot` ID, quoted if needed.
+
+    Strings that are already quoted are returned as they are.
+    Backslashes are kept, because labels contain escapes.
+    """
+    s = str(s)
+    if len(s) > 1 and s.startswith('"') and s.endswith('"'):
+        return s
+    if _DOT_ID.match(s) and s.lower() not in _DOT_RESERVED:
+        return s
+    return '"{s}"'.format(s=s.replace('"', '\\"'))
+
+
+def _format_dot_attr(attr):
+    """Return attribute list in `dot` syntax, without brackets.
+
+    The attributes are sorted by name,
+    so that the output does not depend on
+    how `attr` was built.
+
+    @type attr: `dict`
+    """
+    return ', '.join(
+        '{k}={v}'.format(k=k, v=_dot_quote(v))
+        for k, v in sorted(attr.items()))
+
+
+def _dot_statement(name, attr):
+    """Return `dot` statement for node or edge `name`."""
+    if not attr:
+        return '{name};\n'.format(name=name)
+    return '{name} [{attr}];\n'.format(
+        name=name, attr=_format_dot_attr(attr))
+
+
+def _graph_label(c_fname, graph):
+    """Return label of `graph`, noting if calls were omitted.
+
+    @param c_fname: name of C file, or `None`
+    @return: label, or `None` for no label
+    @rtype: `str` or `None`
+    """
+    depth = graph.graph.get('truncated_at')
+    if depth is None:
+        return c_fname
+    note = 'calls deeper than {depth} levels omitted'.format(depth=depth)
+    if c_fname is None:
+        return note
+    return '{c_fname}\\n({note})'.format(c_fname=c_fname, note=note)
 
 
 def _graph_name_for_latex(c_fname, for_latex):
@@ -184,6 +1296,7 @@ def choose_node_format(node, nest_level, src_line, defined_somewhere,
                        for_latex, multi_page):
     shapes = ['box', 'ellipse', 'octagon', 'hexagon', 'diamond']
     sl = '\\\\'  # after fprintf \\ and after dot \, a single slash !
+    debug = logger.isEnabledFor(logging.DEBUG)
     # color, shape ?
     if nest_level == 0:
         color = _COLORS[0]
@@ -195,7 +1308,8 @@ def choose_node_format(node, nest_level, src_line, defined_somewhere,
         color = None
     # fix underscores ?
     label = _escape_underscores(node, for_latex)
-    logger.debug('Label:\n\t: ' + label)
+    if debug:
+        logger.debug('Label:\n\t: ' + label)
     # src line of def here ?
     if src_line != -1:
         if for_latex:
@@ -213,7 +1327,8 @@ def choose_node_format(node, nest_level, src_line, defined_somewhere,
             # link only if LaTeX label will appear somewhere
             if defined_somewhere:
                 label = sl + 'descref[' + label + ']{' + node + '}'
-    logger.debug('Node dot label:\n\t: ' + label)
+    if debug:
+        logger.debug('Node dot label:\n\t: ' + label)
     return (label, color, shape)
 
 
@@ -230,156 +1345,349 @@ def dot_format_node(node, nest_level, src_line, defined_somewhere,
         node, nest_level, src_line,
         defined_somewhere,
         for_latex, multi_page)
+    attr = _node_attr(label, color, shape)
+    return _dot_statement(_dot_quote(node), attr)
+
+
+def _node_attr(label, color, shape):
+    """Return `dict` of node attributes."""
     if color is None or color == '#ffffff':
-        dot_str = (
-            '{node}[label="{label}" shape={shape}];\n\n').format(
-                node=node,
-                label=label,
-                shape=shape)
-    else:
-        dot_str = (
-            '{node}[label="{label}" '
-            'fillcolor="{color}" shape={shape}];\n\n').format(
-                node=node,
-                label=label,
-                color=color,
-                shape=shape)
-    return dot_str
+        return dict(label=label, shape=shape)
+    return dict(
+        label=label,
+        shape=shape,
+        fillcolor=color,
+        peripheries='0')
 
 
-def dot_format_edge(from_node, to_node, color):
-    dot_str = (
-        'edge [color="{color}"];\n\n'
-        '{from_node}->{to_node}\n').format(
-            color=color,
-            from_node=from_node,
-            to_node=to_node)
-    return dot_str
+def dot_format_edge(from_node, to_node, attr):
+    """Return `dot` statement for edge with attributes `attr`.
+
+    @param attr: edge attributes, or the color of the edge,
+        which was the only attribute before
+    @type attr: `dict` or `str`
+    """
+    if not isinstance(attr, dict):
+        attr = dict(color=attr)
+    name = '{u} -> {v}'.format(
+        u=_dot_quote(from_node), v=_dot_quote(to_node))
+    return _dot_statement(name, attr)
+
+
+def definition_index(graphs, c_fnames):
+    """Return `dict` that maps functions to the files that define them.
+
+    Built once, so that whether a function is defined
+    in some file is answered in constant time.
+
+    @type graphs: `list` of `networkx.DiGraph`
+    @param c_fnames: name of C file of each graph
+    @type c_fnames: `list` of `str`
+    """
+    definitions = dict()
+    for graph, c_fname in zip(graphs, c_fnames):
+        for u, d in graph.nodes(data=True):
+            if d['src_line'] == -1:
+                continue
+            definitions.setdefault(u, c_fname)
+    return definitions
 
 
 def node_defined_in_other_src(node, other_graphs):
-    defined_somewhere = False
-    for graph in other_graphs:
-        if node in graph:
-            src_line = graph.nodes[node]['src_line']
+    """Return `True` if `node` is defined in any of `other_graphs`.
 
-            if src_line != -1:
-                defined_somewhere = True
-    return defined_somewhere
+    Each call scans `other_graphs`. To answer this
+    for many nodes, build `definition_index` once.
+
+    @type other_graphs: `list` of `networkx.DiGraph`
+    @rtype: `bool`
+    """
+    return any(
+        node in graph and graph.nodes[node]['src_line'] != -1
+        for graph in other_graphs)
 
 
 def dump_dot_wo_pydot(
-        graph, other_graphs, c_fname,
-        for_latex, multi_page, rankdir):
-    dot_str = dot_preamble(c_fname, for_latex, rankdir)
-    # format nodes
-    for node in graph:
-        node_dict = graph.nodes[node]
-        defined_somewhere = node_defined_in_other_src(node, other_graphs)
-        nest_level = node_dict['nest_level']
-        src_line = node_dict['src_line']
-        dot_str += dot_format_node(
-            node, nest_level, src_line, defined_somewhere,
-            for_latex, multi_page)
-    # format edges
-    for from_node, to_node in graph.edges():
-        # call order affects edge color, so use only black
-        color = '#000000'
-        dot_str += dot_format_edge(from_node, to_node, color)
-    dot_str += '}\n'
-    logger.debug('dot dump str:\n\n' + dot_str)
+        graph, definitions, c_fname,
+        for_latex, multi_page, rankdir, layout='dot'):
+    """Return `dot` code for `graph`, as a `str`.
+
+    For large graphs, prefer `iter_dot_wo_pydot` or
+    `write_dot_wo_pydot`, which avoid building the string.
+
+    @param definitions: as for `_annotated_nodes`
+    """
+    dot_str = ''.join(iter_dot_wo_pydot(
+        graph, definitions, c_fname,
+        for_latex, multi_page, rankdir, layout))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('dot dump str:\n\n' + dot_str)
     return dot_str
 
 
-def _dump_dot_file(dot_str, dot_fname):
-    """Dump `dot_str` to `dot` file `dot_fname`."""
+def write_dot_wo_pydot(
+        f, graph, definitions, c_fname,
+        for_latex, multi_page, rankdir, layout='dot'):
+    """Write `dot` code for `graph` to file object `f`."""
+    f.writelines(iter_dot_wo_pydot(
+        graph, definitions, c_fname,
+        for_latex, multi_page, rankdir, layout))
+
+
+def iter_dot_wo_pydot(
+        graph, definitions, c_fname,
+        for_latex, multi_page, rankdir, layout='dot'):
+    """Yield `dot` code for `graph`, one statement at a time.
+
+    @param definitions: as for `_annotated_nodes`
+    @rtype: generator of `str`
+    """
+    label = _graph_label(c_fname, graph)
+    size = _graph_size(graph) if layout == 'auto' else None
+    yield dot_preamble(label, for_latex, rankdir, layout, size)
+    nodes = _annotated_nodes(graph, definitions, for_latex, multi_page)
+    for node, attr in nodes:
+        yield _dot_statement(_dot_quote(node), attr)
+    for u, v, d in graph.edges(data=True):
+        yield dot_format_edge(u, v, d)
+    yield '}\n'
+
+
+def iter_merged_dot(graph, for_latex, layout, rankdir, positions=None):
+    """Yield `dot` code for merged `graph`, one statement at a time.
+
+    @param graph: as returned by `_merge_graphs`
+    @param positions: nodes to pin, as returned by
+        `pinned_positions`. If nonempty, then `graph` is
+        laid out by the engine that `pinned_engine` returns.
+    @type positions: `dict` or `None`
+    @rtype: generator of `str`
+    """
+    label = _graph_label(None, graph)
+    size = _graph_size(graph) if layout == 'auto' else None
+    pinned = pinned_engine(graph, layout, positions)
+    if pinned is None:
+        positions = None
+    # `neato -n` reads points, else inches
+    scale = _POINTS_PER_INCH if pinned == 'nop2' else 1
+    yield dot_preamble(
+        label, for_latex, rankdir, layout, size, pinned=pinned)
+    for u, attr in _merged_nodes(graph, for_latex):
+        if positions and u in positions:
+            attr['pos'] = '{x:.6g},{y:.6g}!'.format(
+                x=scale * positions[u][0], y=scale * positions[u][1])
+        yield _dot_statement(_dot_quote(u), attr)
+    for u, v, d in graph.edges(data=True):
+        yield dot_format_edge(u, v, d)
+    yield '}\n'
+
+
+def write_merged_components2dot(
+        graph, dot_dir, for_latex, layout, rankdir):
+    """Dump each weakly connected component of `graph` to a `dot` file.
+
+    The nodes are formatted as by `iter_merged_dot`
+    for the whole `graph`, so colors agree among
+    the components. The label of `graph` is given
+    to the first component, so that `gvpack` keeps it.
+
+    @param graph: as returned by `_merge_graphs`
+    @param dot_dir: directory of the `dot` files
+    @return: paths of `dot` files
+    @rtype: `list` of `str`
+    """
+    components = weakly_connected_components(graph)
+    component_of = dict()
+    for i, nodes in enumerate(components):
+        component_of.update(dict.fromkeys(nodes, i))
+    node_chunks = [list() for _ in components]
+    edge_chunks = [list() for _ in components]
+    for u, attr in _merged_nodes(graph, for_latex):
+        node_chunks[component_of[u]].append(
+            _dot_statement(_dot_quote(u), attr))
+    for u, v, d in graph.edges(data=True):
+        edge_chunks[component_of[u]].append(dot_format_edge(u, v, d))
+    dot_paths = list()
+    label = _graph_label(None, graph)
+    for i, nodes in enumerate(components):
+        size = (len(nodes), len(edge_chunks[i]))
+        preamble = dot_preamble(
+            label if i == 0 else None,
+            for_latex, rankdir, layout, size)
+        dot_chunks = itertools.chain(
+            [preamble], node_chunks[i], edge_chunks[i], ['}\n'])
+        dot_fname = os.path.join(
+            dot_dir, 'component{i}'.format(i=i))
+        dot_paths.append(_dump_dot_file(dot_chunks, dot_fname))
+    return dot_paths
+
+
+def weakly_connected_components(graph):
+    """Return nodes of each weakly connected component of `graph`.
+
+    Works with both `networkx.DiGraph` and `CompactCallGraph`.
+    The components, and the nodes in each,
+    are in the order of the nodes of `graph`.
+
+    @rtype: `list` of `list`
+    """
+    order = dict((u, i) for i, u in enumerate(graph))
+    seen = set()
+    components = list()
+    for u in graph:
+        if u in seen:
+            continue
+        nodes = [u]
+        seen.add(u)
+        queue = collections.deque([u])
+        while queue:
+            v = queue.popleft()
+            neighbors = itertools.chain(
+                graph.successors(v), graph.predecessors(v))
+            for w in neighbors:
+                if w in seen:
+                    continue
+                seen.add(w)
+                nodes.append(w)
+                queue.append(w)
+        nodes.sort(key=order.get)
+        components.append(nodes)
+    return components
+
+
+def _dump_dot_file(dot_chunks, dot_fname):
+    """Dump `dot_chunks` to `dot` file `dot_fname`.
+
+    @type dot_chunks: iterable of `str`
+    """
     dot_path = dot_fname + '.dot'
     with open(dot_path, 'w') as f:
-        f.write(dot_str)
+        f.writelines(dot_chunks)
     logger.info('Dumped dot file.')
     return dot_path
 
 
 def _annotate_graph(
-        graph, other_graphs, c_fname,
+        graph, definitions, c_fname,
         for_latex, multi_page):
     """Return graph with labels, color, styles.
 
     @rtype: `networkx.DiGraph`
     """
     g = nx.DiGraph()
-    graph_label = _graph_name_for_latex(c_fname, for_latex)
+    label = _graph_label(c_fname, graph)
+    graph_label = _graph_name_for_latex(label, for_latex)
     g.graph['graph'] = dict(label=graph_label)
     g.graph['node'] = _graph_node_defaults()
     # annotate nodes
-    for node in graph:
-        defined_somewhere = node_defined_in_other_src(node, other_graphs)
-        node_dict = graph.nodes[node]
+    nodes = _annotated_nodes(graph, definitions, for_latex, multi_page)
+    for node, attr in nodes:
+        g.add_node(node, **attr)
+    # annotate edges
+    for u, v in graph.edges():
+        g.add_edge(u, v)
+    return g
+
+
+def _annotated_nodes(graph, definitions, for_latex, multi_page):
+    """Yield each node of `graph` with its `dot` attributes.
+
+    @param definitions: as returned by `definition_index`,
+        or the graphs of the other files,
+        which were passed before that index
+    @type definitions: `dict` or `list` of `networkx.DiGraph`
+    """
+    if not isinstance(definitions, dict):
+        graphs = list(definitions)
+        definitions = definition_index(graphs, [None] * len(graphs))
+    for node, node_dict in graph.nodes(data=True):
+        # if not defined here, then `node` would be in
+        # `definitions` only if defined in another file
+        defined_somewhere = node in definitions
         nest_level = node_dict['nest_level']
         src_line = node_dict['src_line']
         label, color, shape = choose_node_format(
             node, nest_level, src_line,
             defined_somewhere,
             for_latex, multi_page)
-        if color is None or color == '#ffffff':
-            attr = dict(label=label, shape=shape)
-        else:
-            attr = dict(
-                label=label,
-                shape=shape,
-                fillcolor=color,
-                peripheries='0')
-        g.add_node(node, **attr)
-    # annotate edges
-    for u, v in graph.edges():
-        g.add_edge(u, v)
-    return g
+        yield (node, _node_attr(label, color, shape))
 
 
-def write_graph2dot(graph, other_graphs, c_fname, img_fname,
-                    for_latex, multi_page, layout, rankdir):
-    if pydot is None:
-        print('Pydot not found. Exporting using native exporter.')
-        dot_str = dump_dot_wo_pydot(
-            graph, other_graphs, c_fname,
+def write_graph2dot(graph, definitions, c_fname, img_fname,
+                    for_latex, multi_page, layout, rankdir,
+                    backend='native'):
+    """Dump `graph` to `dot` file with base `img_fname`.
+
+    @param definitions: as for `_annotated_nodes`
+    @param backend: `'native'` to write `dot` directly,
+        `'pydot'` to convert the graph using `pydot`,
+        `'pipe'` to write no file, and return
+        `(img_fname, dot_chunks)` for `pipe2img`
+    """
+    _print_layout_estimate(layout, graph, img_fname)
+    if backend in ('native', 'pipe'):
+        dot_chunks = iter_dot_wo_pydot(
+            graph, definitions, c_fname,
             for_latex=for_latex, multi_page=multi_page,
-            rankdir=rankdir)
-        dot_path = _dump_dot_file(dot_str, img_fname)
+            rankdir=rankdir, layout=layout)
+        if backend == 'pipe':
+            return (img_fname, dot_chunks)
+        dot_path = _dump_dot_file(dot_chunks, img_fname)
     else:
         # dump using networkx and pydot
         g = _annotate_graph(
-            graph, other_graphs, c_fname, for_latex, multi_page)
+            graph, definitions, c_fname, for_latex, multi_page)
         dot_path = _dump_graph_to_dot(g, img_fname, layout, rankdir)
     return dot_path
 
 
-def _set_pydot_layout(pydot_graph, layout, rankdir):
-    pydot_graph.set_splines('true')
-    if layout == 'twopi':
-        pydot_graph.set_ranksep(5)
-        pydot_graph.set_root('main')
-    else:
-        pydot_graph.set_overlap(False)
-        pydot_graph.set_rankdir(rankdir)
+def write_merged_graph2dot(
+        graph, img_fname, for_latex, layout, rankdir,
+        backend='native', positions=None):
+    """Dump merged `graph` to `dot` file with base `img_fname`.
+
+    @param graph: as returned by `_merge_graphs`
+    @param backend: as for `write_graph2dot`
+    @param positions: as for `iter_merged_dot`,
+        supported by the native and pipe backends
+    """
+    _print_layout_estimate(layout, graph, img_fname)
+    if backend in ('native', 'pipe'):
+        dot_chunks = iter_merged_dot(
+            graph, for_latex, layout, rankdir, positions)
+        if backend == 'pipe':
+            return (img_fname, dot_chunks)
+        return _dump_dot_file(dot_chunks, img_fname)
+    g = _format_merged_graph(graph, for_latex)
+    return _dump_graph_to_dot(g, img_fname, layout, rankdir)
+
+
+def _set_pydot_layout(pydot_graph, layout, rankdir, size=None):
+    for k, v in _layout_attr(layout, rankdir, size):
+        pydot_graph.set(k, v)
 
 
 def write_graphs2dot(
         graphs, c_fnames, img_fname,
-        for_latex, multi_page, layout, rankdir):
+        for_latex, multi_page, layout, rankdir,
+        backend='native', canonical=False):
+    if canonical:
+        graphs = [canonical_graph(g) for g in graphs]
     dot_paths = list()
+    definitions = definition_index(graphs, c_fnames)
     for counter, (graph, c_fname) in enumerate(zip(graphs, c_fnames)):
-        other_graphs = list(graphs)
-        other_graphs.remove(graph)
         cur_img_fname = img_fname + str(counter)
         dot_path = write_graph2dot(
-            graph, other_graphs, c_fname, cur_img_fname,
-            for_latex, multi_page, layout, rankdir)
+            graph, definitions, c_fname, cur_img_fname,
+            for_latex, multi_page, layout, rankdir, backend)
         dot_paths.append(dot_path)
     return dot_paths
 
 
 def _merge_graphs(graphs, c_fnames):
     """Compose graphs from multiple C files into a single graph."""
+    if graphs and isinstance(graphs[0], CompactCallGraph):
+        return _merge_compact_graphs(graphs, c_fnames)
     g = nx.compose_all(graphs)
     for graph, c_fname in zip(graphs, c_fnames):
         _annotate_nodes_with_filename(g, graph, c_fname)
@@ -394,7 +1702,8 @@ def _annotate_nodes_with_filename(g, graph, c_fname):
     in graph `g` with `c_fname`.
 
     This function adds the attribute `file_name` to
-    all nodes in `g`.
+    all nodes in `g`, and restores their `src_line`
+    where a later file only calls the function.
     """
     for u, d in graph.nodes(data=True):
         assert u in g, (u, g.nodes())
@@ -406,45 +1715,172 @@ def _annotate_nodes_with_filename(g, graph, c_fname):
         # at most one file
         assert 'file_name' not in dg, dg
         dg['file_name'] = c_fname
+        dg['src_line'] = src_line_no
 
 
 def _mark_call_paths(graph, source, target):
+    """Mark as dashed the edges on call paths from `source` to `target`.
+
+    An edge lies on a call path if `source` reaches the edge,
+    and the edge reaches `target`. Both endpoints are then
+    descendants of `source` and ancestors of `target`,
+    so marking takes linear time. With recursion,
+    the paths can be walks that revisit nodes.
+
+    @return: nodes on call paths,
+        or `None` if `source` or `target` is `None`
+    @rtype: `set`
+    """
     if source is None or target is None:
-        return
+        return None
     source_node = rename_if_reserved_by_dot(source)
     target_node = rename_if_reserved_by_dot(target)
     assert source_node in graph, source_node
     assert target_node in graph, target_node
-    for path in nx.all_simple_paths(
-            graph, source_node, target_node):
-        for u, v in zip(path[:-1], path[1:]):
-            graph.edges[u, v]['style'] = '"dashed"'
+    descendants = _reachable(graph.successors, [source_node])
+    ancestors = _reachable(graph.predecessors, [target_node])
+    nodes = set(descendants) & set(ancestors)
+    if target_node not in nodes:
+        logger.warning('No call path from {s} to {t}.'.format(
+            s=source_node, t=target_node))
+        return set()
+    for u in nodes:
+        for v in graph.successors(u):
+            if v in nodes:
+                graph.edges[u, v]['style'] = '"dashed"'
+    return nodes
+
+
+def neighborhood(graph, nodes, up, down):
+    """Return nodes within `up` calls above and `down` calls below `nodes`.
+
+    @param nodes: names of functions in `graph`
+    @type nodes: iterable
+    @param up: number of levels of callers,
+        or `None` for all ancestors
+    @param down: number of levels of callees,
+        or `None` for all descendants
+    @rtype: `set`
+    """
+    nodes = list(nodes)
+    above = _reachable(graph.predecessors, nodes, max_depth=up)
+    below = _reachable(graph.successors, nodes, max_depth=down)
+    return set(above).union(below)
+
+
+def canonical_graph(graph):
+    """Return copy of `graph` with nodes and edges sorted by name.
+
+    The `dot` code of the copy is the same for
+    the same nodes, edges, and attributes,
+    whatever order `cflow` listed them in.
+
+    @type graph: `networkx.DiGraph` or `CompactCallGraph`
+    @rtype: same as `graph`
+    """
+    if isinstance(graph, CompactCallGraph):
+        g = canonical_graph(graph.to_networkx())
+        return CompactCallGraph.from_networkx(g)
+    g = nx.DiGraph()
+    g.graph.update(graph.graph)
+    g.add_nodes_from(
+        (u, dict(d)) for u, d in sorted(graph.nodes(data=True)))
+    edges = sorted(
+        graph.edges(data=True), key=lambda edge: edge[:2])
+    g.add_edges_from((u, v, dict(d)) for u, v, d in edges)
+    return g
+
+
+def induced_subgraph(graph, nodes):
+    """Return copy of `graph` with only `nodes`.
+
+    Unlike `networkx.DiGraph.subgraph`, the nodes
+    remain in the order of `graph`, so `dot` files
+    do not change between runs.
+
+    @type graph: `networkx.DiGraph` or `CompactCallGraph`
+    @type nodes: `set`
+    @rtype: same as `graph`
+    """
+    if isinstance(graph, CompactCallGraph):
+        return graph.subgraph(nodes)
+    g = nx.DiGraph()
+    g.graph.update(graph.graph)
+    g.add_nodes_from(
+        (u, dict(d)) for u, d in graph.nodes(data=True) if u in nodes)
+    for u in g:
+        for v, d in graph.adj[u].items():
+            if v in nodes:
+                g.add_edge(u, v, **d)
+    return g
+
+
+def _reachable(neighbors, sources, max_depth=None):
+    """Return `dict` of nodes reachable from `sources`, with distances.
+
+    Breadth-first search that works with both
+    `networkx.DiGraph` and `CompactCallGraph`.
+
+    @param neighbors: maps a node to its neighbors,
+        for example `graph.successors`
+    @type neighbors: callable
+    @param max_depth: largest distance to search,
+        or `None` for no bound
+    @rtype: `dict`
+    """
+    distances = dict.fromkeys(sources, 0)
+    queue = collections.deque(distances)
+    while queue:
+        u = queue.popleft()
+        d = distances[u] + 1
+        if max_depth is not None and d > max_depth:
+            continue
+        for v in neighbors(u):
+            if v in distances:
+                continue
+            distances[v] = d
+            queue.append(v)
+    return distances
 
 
 def _format_merged_graph(graph, for_latex):
     """Return graph with `dot` labeling."""
     g = nx.DiGraph()
+    label = _graph_label(None, graph)
+    if label is not None:
+        graph_label = _graph_name_for_latex(label, for_latex)
+        g.graph['graph'] = dict(label=graph_label)
     g.graph['node'] = _graph_node_defaults()
+    for u, attr in _merged_nodes(graph, for_latex):
+        g.add_node(u, **attr)
+    for u, v, d in graph.edges(data=True):
+        g.add_edge(u, v, **d)
+    return g
+
+
+def _merged_nodes(graph, for_latex):
+    """Yield each node of merged `graph` with its `dot` attributes."""
     c_fnames = _collect_file_names(graph)
     colormap = _make_colormap(c_fnames)
     shape = '"ellipse"'
     for u, d in graph.nodes(data=True):
-        _format_merged_node(
-            u, d, g, for_latex, shape, colormap)
-    for u, v, d in graph.edges(data=True):
-        g.add_edge(u, v, **d)
-    return g
+        attr = _format_merged_node(u, d, for_latex, shape, colormap)
+        yield (u, attr)
 
 
 def _collect_file_names(graph):
-    """Return `set` of values of node attribute `file_name`."""
+    """Return sorted `list` of values of node attribute `file_name`.
+
+    Sorted, so that each file gets the same color
+    from `_make_colormap` in every run.
+    """
     c_fnames = set()
     for u, d in graph.nodes(data=True):
         c_fname = d.get('file_name')
         if c_fname is None:
             continue
         c_fnames.add(c_fname)
-    return c_fnames
+    return sorted(c_fnames)
 
 
 def _make_colormap(c_fnames):
@@ -456,8 +1892,8 @@ def _make_colormap(c_fnames):
     return colormap
 
 
-def _format_merged_node(u, d, g, for_latex, shape, colormap):
-    """Add node `u` to `g` forming label using `d`."""
+def _format_merged_node(u, d, for_latex, shape, colormap):
+    """Return attributes of node `u`, forming label using `d`."""
     src_line = d['src_line']
     file_name = d.get('file_name')
     node_name = _escape_underscores(u, for_latex)
@@ -481,13 +1917,18 @@ def _format_merged_node(u, d, g, for_latex, shape, colormap):
             shape=shape,
             fillcolor=fillcolor,
             peripheries='0')
-    g.add_node(u, **attr)
+    return attr
 
 
 def _dump_graph_to_dot(graph, img_fname, layout, rankdir):
-    """Dump `graph` to `dot` file with base `img_fname`."""
+    """Dump `graph` to `dot` file with base `img_fname`, using `pydot`."""
+    if pydot is None:
+        raise ImportError(
+            'The `pydot` backend requires `pydot`: '
+            '`pip install pydot`')
     pydot_graph = nx.drawing.nx_pydot.to_pydot(graph)
-    _set_pydot_layout(pydot_graph, layout, rankdir)
+    size = _graph_size(graph) if layout == 'auto' else None
+    _set_pydot_layout(pydot_graph, layout, rankdir, size)
     dot_path = img_fname + '.dot'
     pydot_graph.write(dot_path, format='dot')
     return dot_path
@@ -508,17 +1949,513 @@ def check_cflow_dot_availability():
     return dep_paths
 
 
-def dot2img(dot_paths, img_format, layout):
-    print('This may take some time... ...')
+def pack_components(dot_paths, packed_fname, layout, jobs=1):
+    """Lay out each `dot` file in parallel, and pack the layouts.
+
+    Each file is laid out by `layout` to `dot` with positions,
+    and the results are combined by `gvpack` into one file.
+    Render that file with `dot2img`, passing `neato` as
+    `layout` and `-n2 -s` as `layout_args`,
+    which keeps the positions.
+
+    @param dot_paths: as returned by `write_merged_components2dot`
+    @param packed_fname: base name of the packed `dot` file
+    @param jobs: number of concurrent Graphviz processes
+    @return: path of the packed `dot` file
+    @rtype: `str`
+    """
+    if layout == 'auto':
+        # the engine is set in each `dot` file
+        layout = 'dot'
+    laid_out = [
+        '{root}.gv'.format(root=os.path.splitext(dot_path)[0])
+        for dot_path in dot_paths]
+
+    def lay_out(paths):
+        dot_path, gv_path = paths
+        dot_cmd = [layout, '-Tdot', '-o', gv_path, dot_path]
+        logger.debug(dot_cmd)
+        return _run_collecting_errors(dot_cmd)
+    errors = _map_jobs(lay_out, list(zip(dot_paths, laid_out)), jobs)
+    _raise_failures(dot_paths, errors, 'layouts')
+    packed_path = packed_fname + '.dot'
+    pack_cmd = ['gvpack', '-g', '-o' + packed_path]
+    pack_cmd.extend(laid_out)
+    logger.debug(pack_cmd)
+    error = _run_collecting_errors(pack_cmd)
+    _raise_failures([packed_path], [error], 'packings')
+    return packed_path
+
+
+def load_layout_cache(fname):
+    """Return node positions saved by `save_layout_cache`.
+
+    @return: maps the base name of each `dot` file to a `dict`
+        that maps node names to `dict`s with keys:
+        - `pos`: position `[x, y]`, in inches
+        - `neighbors`: as returned by `_neighbor_signature`
+        The result is empty if `fname` is missing or unreadable.
+    @rtype: `dict`
+    """
+    try:
+        with open(fname) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        logger.info('No layout cache read from {fname}: {e}'.format(
+            fname=fname, e=e))
+        return dict()
+
+
+def save_layout_cache(fname, layout_cache):
+    """Write `layout_cache` to JSON file `fname`, atomically."""
+    dirname = os.path.dirname(os.path.abspath(fname))
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(layout_cache, f, sort_keys=True)
+    _replace_file(tmp_path, fname)
+
+
+def pinned_positions(graph, layout):
+    """Return positions of unchanged nodes, and new signatures.
+
+    A node is unchanged if it was laid out before
+    with the same callers and callees.
+
+    @param layout: as stored in a layout cache for
+        this graph, or `None`
+    @return: `(positions, signatures)`, where
+        `positions` maps unchanged nodes to `(x, y)`,
+        and `signatures` maps each node of `graph`
+        to its `_neighbor_signature`
+    @rtype: `tuple` of `dict`
+    """
+    if layout is None:
+        layout = dict()
+    positions = dict()
+    signatures = dict()
+    for u in graph:
+        signature = _neighbor_signature(graph, u)
+        signatures[u] = signature
+        old = layout.get(u)
+        if old is None or old.get('neighbors') != signature:
+            continue
+        if old.get('pos') is None:
+            continue
+        positions[u] = tuple(old['pos'])
+    return positions, signatures
+
+
+def pinned_engine(graph, layout, positions):
+    """Return layout engine that keeps `positions`, or `None`.
+
+    If every node of `graph` has a position, then
+    the engine is `nop2`, which is `neato -n2`:
+    the nodes are not laid out, only the edges routed.
+    Otherwise, the engine is `neato` or `fdp`,
+    which lay out the other nodes around the pinned ones.
+    Both take time quadratic in the number of nodes,
+    whatever the number pinned, so `neato` replaces
+    another engine only for graphs within `_PINNED_NEATO_SIZE`.
+    For larger graphs, the result is `None`,
+    and `layout` lays out the graph anew.
+
+    @param layout: as for `iter_merged_dot`
+    @param positions: as returned by `pinned_positions`
+    @rtype: `str` or `None`
+    """
+    if not positions:
+        return None
+    if all(u in positions for u in graph):
+        return 'nop2'
+    if layout in ('neato', 'fdp'):
+        return layout
+    n_nodes, n_edges = _graph_size(graph)
+    max_nodes, max_edges = _PINNED_NEATO_SIZE
+    if n_nodes <= max_nodes and n_edges <= max_edges:
+        return 'neato'
+    return None
+
+
+def _neighbor_signature(graph, u):
+    """Return digest of the callers and callees of node `u`."""
+    h = hashlib.sha1()
+    for neighbors in (graph.predecessors(u), graph.successors(u)):
+        for v in sorted(neighbors):
+            h.update(v.encode('utf-8'))
+            h.update(b'\0')
+        h.update(b'\1')
+    return h.hexdigest()
+
+
+def read_plain_positions(plain_path):
+    """Return node positions from Graphviz `-Tplain` output.
+
+    @return: maps node names to `(x, y)`, in inches
+    @rtype: `dict`
+    """
+    positions = dict()
+    with open(plain_path) as f:
+        for line in f:
+            fields = line.split(None, 4)
+            if len(fields) < 4 or fields[0] != 'node':
+                continue
+            name = fields[1]
+            if name.startswith('"'):
+                # identifiers need no quotes
+                name = name[1:-1]
+            positions[name] = (float(fields[2]), float(fields[3]))
+    return positions
+
+
+def update_layout_cache(layout_cache, signatures, dot_paths):
+    """Store positions from rendering `dot_paths` in `layout_cache`.
+
+    The positions are read from the `-Tplain` output that
+    `dot2img` writes next to each `dot` file, if passed
+    `plain=True`. These files are then removed.
+
+    @param signatures: maps base names of `dot` files to
+        signatures returned by `pinned_positions`
+    """
     for dot_path in dot_paths:
+        root = os.path.splitext(dot_path)[0]
+        if root not in signatures:
+            continue
+        plain_path = root + '.plain'
+        positions = read_plain_positions(plain_path)
+        os.remove(plain_path)
+        layout_cache[root] = {
+            u: dict(pos=positions[u], neighbors=signature)
+            for u, signature in signatures[root].items()
+            if u in positions}
+
+
+def dot2img(
+        dot_paths, img_format, layout, jobs=1, layout_args=None,
+        plain=False, cache_dir=None):
+    """Render each `dot` file with Graphviz.
+
+    Each file is laid out once, and rendered to
+    every format by the same Graphviz process,
+    which is passed a `-T` and `-o` per format.
+    Up to `jobs` files are rendered concurrently.
+    A failed render does not stop the other renders.
+    The failures are reported at the end, by raising
+    an `Exception` that lists them.
+
+    @param img_format: output formats
+    @type img_format: `str` (comma-separated) or `list` of `str`
+    @param layout_args: more arguments for `layout`
+    @type layout_args: `list` of `str`
+    @param plain: if `True`, then also write node positions
+        in `-Tplain` format, to a `.plain` file next to
+        each `dot` file, in the same Graphviz call
+    @param cache_dir: directory of cached renders, or `None`.
+        Each rendered file is stored there, keyed by
+        the contents of the `dot` file, the format,
+        and the Graphviz program and its arguments.
+        Cached files are copied, not linked, so that
+        editing rendered files leaves the cache intact,
+        and only the missing formats are rendered.
+    @type cache_dir: `str` or `None`
+    """
+    if isinstance(img_format, str):
+        img_formats = img_format.split(',')
+    else:
+        img_formats = list(img_format)
+    if plain:
+        img_formats.append('plain')
+    print('This may take some time... ...')
+    if layout == 'auto':
+        # the engine is set in each `dot` file
+        layout = 'dot'
+    program = [layout]
+    if layout_args:
+        program.extend(layout_args)
+    if cache_dir is not None:
+        path = _find_executable(layout)
+        if path is None:
+            # let the render report it
+            cache_dir = None
+        else:
+            _make_dirs(cache_dir)
+            version = _executable_id(path)
+    reused = list()
+
+    def render(dot_path):
         root, ext = os.path.splitext(dot_path)
         assert ext == '.dot', ext
-        img_fname = '{root}.{ext}'.format(
-            root=root, ext=img_format)
-        dot_cmd = [layout, '-T' + img_format, '-o', img_fname, dot_path]
+        outputs = [
+            (fmt, '{root}.{ext}'.format(root=root, ext=fmt))
+            for fmt in img_formats]
+        if cache_dir is not None:
+            keys = _render_cache_keys(
+                dot_path, program, img_formats, version)
+            cached = dict(
+                (fmt, os.path.join(cache_dir, keys[fmt]))
+                for fmt in img_formats)
+            missing = list()
+            for fmt, img_fname in outputs:
+                if _restore_rendered(cached[fmt], img_fname, dot_path):
+                    reused.append(img_fname)
+                else:
+                    missing.append((fmt, img_fname))
+            outputs = missing
+            if not outputs:
+                return None
+        dot_cmd = _render_command(program, outputs)
+        dot_cmd.append(dot_path)
         logger.debug(dot_cmd)
-        subprocess.check_call(dot_cmd)
-    print(img_format + ' produced successfully from dot.')
+        error = _run_collecting_errors(dot_cmd)
+        if error is None and cache_dir is not None:
+            for fmt, img_fname in outputs:
+                _store_rendered(img_fname, cached[fmt])
+        return error
+    errors = _map_jobs(render, dot_paths, jobs)
+    _raise_failures(dot_paths, errors, 'renders')
+    if reused:
+        print('Reused {n} rendered files from cache.'.format(
+            n=len(reused)))
+    print(', '.join(img_formats) + ' produced successfully from dot.')
+
+
+def pipe2img(dot_sources, img_format, layout, jobs=1, plain=False):
+    """Render `dot` code piped into Graphviz, writing only images.
+
+    Each Graphviz process reads the `dot` code from its
+    standard input, written by a thread as it is formatted,
+    so no `dot` file is written or read.
+    The render cache of `dot2img` is not used,
+    because the `dot` code is not known before rendering.
+
+    @param dot_sources: `(img_fname, dot_chunks)` for each graph,
+        as returned by `write_graph2dot` with `backend='pipe'`
+    @param img_format, layout, jobs, plain: as for `dot2img`
+    """
+    if isinstance(img_format, str):
+        img_formats = img_format.split(',')
+    else:
+        img_formats = list(img_format)
+    if plain:
+        img_formats.append('plain')
+    print('This may take some time... ...')
+    if layout == 'auto':
+        # the engine is set in the `dot` code
+        layout = 'dot'
+
+    def render(source):
+        img_fname, dot_chunks = source
+        outputs = [
+            (fmt, '{root}.{ext}'.format(root=img_fname, ext=fmt))
+            for fmt in img_formats]
+        dot_cmd = _render_command([layout], outputs)
+        logger.debug(dot_cmd)
+        _, error = _pipe_to_graphviz(dot_cmd, dot_chunks)
+        return error
+    errors = _map_jobs(render, dot_sources, jobs)
+    _raise_failures(
+        [img_fname for img_fname, _ in dot_sources], errors, 'renders')
+    print(', '.join(img_formats) + ' produced successfully from dot.')
+
+
+def render_dot(dot_code, img_format='svg', layout='dot', layout_args=None):
+    """Return image rendered by Graphviz, without any files.
+
+    For example, to serve an SVG of a merged graph:
+
+    ```
+    chunks = iter_merged_dot(graph, False, 'dot', 'LR')
+    svg = render_dot(chunks, 'svg')
+    ```
+
+    @param dot_code: `dot` code, whole or in chunks
+        (for example from `iter_dot_wo_pydot`)
+    @type dot_code: `str` or iterable of `str`
+    @param img_format: a Graphviz output format
+    @param layout: Graphviz program, or `'auto'`
+        if the engine is set in `dot_code`
+    @param layout_args: more arguments for `layout`
+    @type layout_args: `list` of `str`
+    @return: contents of the image
+    @rtype: `bytes`
+    """
+    if isinstance(dot_code, str):
+        dot_code = [dot_code]
+    if layout == 'auto':
+        layout = 'dot'
+    dot_cmd = [layout]
+    if layout_args:
+        dot_cmd.extend(layout_args)
+    dot_cmd.append('-T' + img_format)
+    img, error = _pipe_to_graphviz(dot_cmd, dot_code)
+    if error is not None:
+        raise Exception(error)
+    return img
+
+
+def _render_command(program, outputs):
+    """Return Graphviz command with a `-T` and `-o` per output.
+
+    @param program: Graphviz program and its arguments
+    @param outputs: `(format, file name)` pairs
+    @rtype: `list` of `str`
+    """
+    dot_cmd = list(program)
+    for fmt, img_fname in outputs:
+        dot_cmd.extend(['-T' + fmt, '-o', img_fname])
+    return dot_cmd
+
+
+def _pipe_to_graphviz(cmd, dot_chunks):
+    """Run `cmd` with `dot_chunks` written to its standard input.
+
+    A thread writes the chunks, and another reads
+    the standard error, while the standard output
+    is read here, so that no pipe fills up.
+
+    @return: `(stdout, error)`, where `error` is
+        as returned by `_run_collecting_errors`
+    @rtype: `tuple` of `bytes` and `str` or `None`
+    """
+    try:
+        p = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        return (None, str(e))
+    # exceptions raised while formatting `dot` code
+    failures = list()
+    stderr = list()
+
+    def write():
+        try:
+            for chunk in dot_chunks:
+                p.stdin.write(chunk.encode('utf-8'))
+        except (IOError, OSError):
+            # Graphviz exited, and reports why
+            pass
+        except Exception as e:
+            failures.append(e)
+        finally:
+            try:
+                p.stdin.close()
+            except (IOError, OSError):
+                pass
+
+    def read_stderr():
+        stderr.append(p.stderr.read())
+    threads = [
+        threading.Thread(target=write),
+        threading.Thread(target=read_stderr)]
+    for t in threads:
+        t.start()
+    stdout = p.stdout.read()
+    for t in threads:
+        t.join()
+    p.wait()
+    if failures:
+        raise failures[0]
+    stderr = bytes2str(stderr[0])
+    if p.returncode == 0:
+        if stderr:
+            logger.warning(stderr)
+        return (stdout, None)
+    return (stdout, '`{cmd}` returned {code}:\n{stderr}'.format(
+        cmd=' '.join(cmd), code=p.returncode, stderr=stderr))
+
+
+def _render_cache_keys(dot_path, program, img_formats, version):
+    """Return `dict` that maps each format to a cache key.
+
+    The key is a hash of the contents of `dot_path`,
+    the format, `program` (with arguments), and `version`.
+    """
+    h = hashlib.sha256()
+    for s in [version] + program:
+        h.update(s.encode('utf-8'))
+        h.update(b'\0')
+    with open(dot_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    keys = dict()
+    for fmt in img_formats:
+        hf = h.copy()
+        hf.update(b'\0' + fmt.encode('utf-8'))
+        keys[fmt] = hf.hexdigest()
+    return keys
+
+
+def _restore_rendered(cached_path, img_fname, dot_path):
+    """Return `True` if `cached_path` was restored to `img_fname`."""
+    if not _touch_cached(cached_path):
+        return False
+    # copied, not linked, so that editing
+    # `img_fname` leaves the cache intact
+    try:
+        shutil.copyfile(cached_path, img_fname)
+    except (IOError, OSError):
+        # evicted by another run, so render it
+        return False
+    return True
+
+
+def _store_rendered(img_fname, cached_path):
+    """Copy `img_fname` to the render cache as `cached_path`."""
+    cache_dir = os.path.dirname(cached_path)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.')
+    os.close(fd)
+    try:
+        shutil.copyfile(img_fname, tmp_path)
+        _replace_file(tmp_path, cached_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _find_executable(name):
+    """Return path of program `name` in `$PATH`, or `None`."""
+    for dirname in os.environ.get('PATH', '').split(os.pathsep):
+        path = os.path.join(dirname, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def _raise_failures(dot_paths, errors, what):
+    """Log errors, and raise `Exception` listing failed files, if any.
+
+    @param errors: as returned by `_run_collecting_errors`
+        for each of `dot_paths`
+    @param what: plural noun for the failed operations
+    """
+    failed = [
+        (dot_path, error)
+        for dot_path, error in zip(dot_paths, errors)
+        if error is not None]
+    for dot_path, error in failed:
+        logger.error('Failed to process {path}:\n{error}'.format(
+            path=dot_path, error=error))
+    if failed:
+        raise Exception((
+            '{n} of {m} {what} failed: {paths}').format(
+                n=len(failed), m=len(dot_paths), what=what,
+                paths=', '.join(path for path, _ in failed)))
+
+
+def _run_collecting_errors(cmd):
+    """Run `cmd`, and return error message, or `None` if it succeeds."""
+    try:
+        p = subprocess.Popen(cmd, stderr=subprocess.PIPE)
+    except OSError as e:
+        return str(e)
+    _, stderr = p.communicate()
+    stderr = bytes2str(stderr)
+    if p.returncode == 0:
+        if stderr:
+            logger.warning(stderr)
+        return None
+    return '`{cmd}` returned {code}:\n{stderr}'.format(
+        cmd=' '.join(cmd), code=p.returncode, stderr=stderr)
 
 
 def latex_preamble_str():
@@ -556,15 +2493,29 @@ def write_latex():
     latex_str = latex_preamble_str()
 
 
+def _output_formats(s):
+    """Return `list` of formats from comma-separated `s`."""
+    formats = [fmt.strip() for fmt in s.split(',')]
+    for fmt in formats:
+        if fmt not in _IMG_FORMATS:
+            raise argparse.ArgumentTypeError(
+                'invalid format: {fmt!r} (choose from {choices})'.format(
+                    fmt=fmt, choices=', '.join(_IMG_FORMATS)))
+    # without duplicates, in the order given
+    return sorted(set(formats), key=formats.index)
+
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', '--input-filenames', nargs='+',
                         help='filename(s) of C source code files to be parsed.')
     parser.add_argument('-o', '--output-filename', default='cflow',
                         help='name of dot, svg, pdf etc file produced')
-    parser.add_argument('-f', '--output-format', default='svg',
-                        choices=['dot', 'svg', 'pdf', 'png'],
-                        help='output file format')
+    parser.add_argument('-f', '--output-format', default=['svg'],
+                        type=_output_formats,
+                        help='output file format, or comma-separated '
+                        + 'formats, each rendered from one layout ('
+                        + ', '.join(_IMG_FORMATS) + ')')
     parser.add_argument('-l', '--latex-svg', default=False, action='store_true',
                         help='produce SVG for import to LaTeX via Inkscape')
     parser.add_argument('-m', '--multi-page', default=False, action='store_true',
@@ -578,6 +2529,40 @@ def parse_args():
     parser.add_argument('-r', '--reverse', default=False, action='store_true',
                         help='pass --reverse option to cflow, '
                         + 'chart callee-caller dependencies')
+    parser.add_argument('-d', '--depth', default=None, type=int,
+                        metavar='N',
+                        help='plot calls up to N levels below the '
+                        + 'starting functions, passing --depth to cflow')
+    parser.add_argument('--main', default=None, metavar='NAME',
+                        help='pass --main option to cflow, '
+                        + 'starting the tree from function NAME')
+    parser.add_argument('--start', default=list(), nargs='+',
+                        metavar='NAME',
+                        help='more functions to start the tree from, '
+                        + 'each passed to cflow as --main')
+    parser.add_argument('--with-reverse', default=False,
+                        action='store_true',
+                        help='also chart callee-caller dependencies, '
+                        + 'derived from the same cflow output, '
+                        + 'in files named after the output file '
+                        + 'with suffix "_reverse"')
+    parser.add_argument('-b', '--brief', default=False, action='store_true',
+                        help='pass --brief option to cflow, '
+                        + 'expanding each function only once '
+                        + '(same graph, less output to parse). '
+                        + 'Cannot be combined with --depth, '
+                        + '--prune-excluded, or --stop-at')
+    parser.add_argument('--xref', default=False, action='store_true',
+                        help='build graphs from the cross-reference '
+                        + 'table of cflow --xref, instead of '
+                        + 'the call tree')
+    parser.add_argument('--whole-program', default=False,
+                        action='store_true',
+                        help='call cflow once for all input files, '
+                        + 'resolving calls across files')
+    parser.add_argument('--compact', default=False, action='store_true',
+                        help='store graphs with integer ids and arrays, '
+                        + 'using less memory for large programs')
     parser.add_argument('--merge', default=False, action='store_true',
                         help='create a single graph for multiple C files.')
     parser.add_argument(
@@ -588,17 +2573,92 @@ def parse_args():
         '--target', action='store',
         help=('end node for call path highlighting'
             'Available only with option `--merge`.'))
+    parser.add_argument(
+        '--paths-only', default=False, action='store_true',
+        help=('plot only the call paths from `--source` '
+              'to `--target`. Available only with option `--merge`.'))
+    parser.add_argument(
+        '--focus', default=list(), nargs='+', metavar='FUNC',
+        help=('plot only the functions near each of these, '
+              'each in a file named after the function. '
+              'Available only with option `--merge`.'))
+    parser.add_argument(
+        '--up', default=1, type=int, metavar='K',
+        help='levels of callers to plot with `--focus`')
+    parser.add_argument(
+        '--down', default=1, type=int, metavar='K',
+        help='levels of callees to plot with `--focus`')
     parser.add_argument(
         '-g', '--layout', default='dot',
-        choices=['dot', 'neato', 'twopi', 'circo', 'fdp', 'sfdp'],
-        help='graphviz layout algorithm.')
+        choices=['dot', 'neato', 'twopi', 'circo', 'fdp', 'sfdp', 'auto'],
+        help=('graphviz layout algorithm. `auto` chooses '
+              'by the size of each graph, and trades quality '
+              'for speed on large graphs.'))
+    parser.add_argument(
+        '--split-components', default=False, action='store_true',
+        help=('lay out the weakly connected components concurrently, '
+              'and pack them with `gvpack`. '
+              'Available only with option `--merge`.'))
+    parser.add_argument(
+        '--layout-cache', metavar='FILE',
+        help=('JSON file of node positions from the previous run. '
+              'Nodes whose callers and callees are unchanged keep '
+              'their positions. If all are unchanged, then only '
+              'edges are routed. Otherwise, `neato` places the rest, '
+              'if the graph is small, else the graph is laid out anew. '
+              'Available only with option `--merge`.'))
     parser.add_argument(
         '--rankdir', default='LR',
         choices=['TB', 'LR', 'BT', 'RL'],
         help='graph layout direction given to `dot`.')
+    parser.add_argument(
+        '--backend', default='native',
+        choices=['native', 'pydot'],
+        help=('how to write `dot` files: directly (faster), '
+              'or through `pydot`.'))
+    parser.add_argument(
+        '--canonical', default=False, action='store_true',
+        help=('sort nodes and edges by name in `dot` files, '
+              'so that the same graph gives the same file, '
+              'which the render cache can reuse'))
+    parser.add_argument(
+        '--no-dot-files', default=False, action='store_true',
+        help=('pipe `dot` code into Graphviz, writing only '
+              'the images, and not using the render cache'))
     parser.add_argument(
         '-x', '--exclude', default='',
-        help='file listing functions to ignore')
+        help=('file listing functions to ignore, one per line, '
+              'as a name, a glob, or a regular expression '
+              'prefixed with `re:`'))
+    parser.add_argument(
+        '--exclude-externals', default=False, action='store_true',
+        help='ignore functions not defined in the input files')
+    parser.add_argument(
+        '--prune-excluded', default=False, action='store_true',
+        help=('also ignore what `cflow` lists under '
+              'ignored functions, without parsing it'))
+    parser.add_argument(
+        '--stop-at', default=list(), nargs='+', metavar='PATTERN',
+        help=('functions to plot without their callees, '
+              'as names or patterns like those of `--exclude`'))
+    parser.add_argument(
+        '-j', '--jobs', default=1, type=int,
+        help=('number of `cflow` and Graphviz processes '
+              'to run in parallel (0 for one per CPU)'))
+    parser.add_argument(
+        '--cache-dir', default=_default_cache_dir(),
+        help=('directory where `cflow` output is cached, '
+              'keyed by file contents, `cflow` version, and options, '
+              'and rendered files, keyed by `dot` contents, format, '
+              'and Graphviz version'))
+    parser.add_argument(
+        '--cache-size', default=256, type=int,
+        help=('maximum size of each of the `cflow` and '
+              'render caches, in megabytes'))
+    parser.add_argument(
+        '--no-cache', default=False, action='store_true',
+        help=('always call `cflow` and Graphviz, '
+              'without reading or writing the cache'))
     parser.add_argument(
         '-v', '--verbosity', default='ERROR',
         choices=['ERROR', 'WARNING', 'INFO', 'DEBUG'],
@@ -611,20 +2671,214 @@ def parse_args():
         parser.print_help()
         sys.exit(1)
     args = parser.parse_args()
+    if args.xref and args.reverse:
+        parser.error('`--xref` cannot be combined with `--reverse`')
+    if args.xref and (
+            args.depth is not None or args.main or args.start):
+        parser.error(
+            '`--xref` cannot be combined with '
+            '`--depth`, `--main`, or `--start`')
+    # a function expanded only under skipped lines
+    # would lose its callees, where `[see N]` refers to it
+    if args.brief and (
+            args.depth is not None or args.prune_excluded or
+            args.stop_at):
+        parser.error(
+            '`--brief` cannot be combined with '
+            '`--depth`, `--prune-excluded`, or `--stop-at`')
+    if args.depth is not None and args.depth < 0:
+        parser.error('`--depth` must be nonnegative')
+    if args.split_components and not args.merge:
+        parser.error('`--split-components` requires `--merge`')
+    if args.split_components and args.backend != 'native':
+        parser.error(
+            '`--split-components` requires `--backend native`')
+    if args.layout_cache and not args.merge:
+        parser.error('`--layout-cache` requires `--merge`')
+    if args.layout_cache and args.backend != 'native':
+        parser.error('`--layout-cache` requires `--backend native`')
+    if args.layout_cache and args.split_components:
+        parser.error(
+            '`--layout-cache` cannot be combined with '
+            '`--split-components`')
+    if args.no_dot_files and args.backend != 'native':
+        parser.error('`--no-dot-files` requires `--backend native`')
+    if args.no_dot_files and args.split_components:
+        parser.error(
+            '`--no-dot-files` cannot be combined with '
+            '`--split-components`, which packs `dot` files')
+    if args.paths_only and not args.merge:
+        parser.error('`--paths-only` requires `--merge`')
+    if args.paths_only and (args.source is None or args.target is None):
+        parser.error('`--paths-only` requires `--source` and `--target`')
+    if args.focus and not args.merge:
+        parser.error('`--focus` requires `--merge`')
+    try:
+        exclusion_matcher(args.stop_at)
+        if args.exclude:
+            exclusion_matcher(read_exclusion_patterns(args.exclude))
+    except ValueError as e:
+        parser.error(str(e))
+    except (IOError, OSError) as e:
+        parser.error('cannot read `--exclude` file: {e}'.format(e=e))
+    if args.up < 0 or args.down < 0:
+        parser.error('`--up` and `--down` must be nonnegative')
+    if args.with_reverse and args.reverse:
+        parser.error(
+            '`--with-reverse` cannot be combined with `--reverse`')
     return args
 
 
 def rm_excluded_funcs(list_fname, graphs):
+    """Remove functions matched by patterns listed in file.
+
+    Passing `exclude` to `cflow_graphs` avoids
+    creating these nodes in the first place.
+
+    @param list_fname: as for `read_exclusion_patterns`
+    @type graphs: `list` of `networkx.DiGraph`
+    """
     # nothing ignored ?
     if not list_fname:
         return
-    # load list of ignored functions
-    rm_nodes = [line.strip() for line in open(list_fname).readlines()]
-    # delete them
+    exclude = exclusion_matcher(read_exclusion_patterns(list_fname))
+    if exclude is None:
+        return
     for graph in graphs:
-        for node in rm_nodes:
-            if node in graph:
-                graph.remove_node(node)
+        graph.remove_nodes_from([
+            u for u, d in graph.nodes(data=True)
+            if exclude(u, d['src_line'])])
+
+
+def rm_external_funcs(graphs, c_fnames):
+    """Remove functions not defined in any of `c_fnames`.
+
+    For graphs from `cflow_graphs`, where calls to functions
+    defined in other input files have `src_line == -1` too.
+
+    @type graphs: `list` of `networkx.DiGraph` or `CompactCallGraph`
+    @param c_fnames: name of C file of each graph
+    @type c_fnames: `list` of `str`
+    """
+    definitions = definition_index(graphs, c_fnames)
+    for graph in graphs:
+        graph.remove_nodes_from([
+            u for u, d in graph.nodes(data=True)
+            if d['src_line'] == -1 and u not in definitions])
+
+
+def _write_merged_outputs(
+        graph, source, target, paths_only, focus, up, down,
+        img_fname, for_latex, layout, rankdir, backend,
+        split_components=False, jobs=1,
+        layout_cache=None, signatures=None, canonical=False):
+    """Mark call paths in merged `graph`, and dump it to `dot`.
+
+    If `focus` is nonempty, then for each function in `focus`,
+    only its `neighborhood` is dumped, to a file named
+    after `img_fname` and the function.
+
+    If `split_components`, then the weakly connected
+    components are laid out concurrently, and packed
+    by `pack_components`.
+
+    If `layout_cache` is given, then nodes that are unchanged
+    since the positions there were stored are pinned,
+    and the signatures of the nodes are stored in
+    `signatures`, for `update_layout_cache`.
+
+    If `canonical`, then each graph is dumped
+    as sorted by `canonical_graph`.
+
+    @return: paths of `dot` files
+    @rtype: `list` of `str`
+    @raise Exception: if `paths_only`,
+        and no call path from `source` to `target` exists
+    """
+    path_nodes = _mark_call_paths(graph, source, target)
+    if paths_only and path_nodes is not None:
+        if not path_nodes:
+            raise Exception((
+                'No call path from {s} to {t}, '
+                'so `--paths-only` leaves nothing to draw.').format(
+                    s=source, t=target))
+        graph.remove_nodes_from(
+            [u for u in graph if u not in path_nodes])
+    if not focus:
+        dot_path = _write_merged(
+            graph, img_fname, for_latex, layout, rankdir, backend,
+            split_components, jobs, layout_cache, signatures,
+            canonical)
+        return [dot_path]
+    dot_paths = list()
+    for func in focus:
+        u = rename_if_reserved_by_dot(func)
+        if u not in graph:
+            logger.warning(
+                'Function `{func}` not found, skipping it.'.format(
+                    func=func))
+            continue
+        nodes = neighborhood(graph, [u], up, down)
+        sub = induced_subgraph(graph, nodes)
+        focus_fname = '{img_fname}_{func}'.format(
+            img_fname=img_fname, func=func)
+        dot_path = _write_merged(
+            sub, focus_fname, for_latex, layout, rankdir, backend,
+            split_components, jobs, layout_cache, signatures,
+            canonical)
+        dot_paths.append(dot_path)
+    return dot_paths
+
+
+def _write_merged(
+        graph, img_fname, for_latex, layout, rankdir, backend,
+        split_components, jobs, layout_cache, signatures, canonical):
+    """Dump merged `graph` to `dot`, as selected."""
+    if canonical:
+        graph = canonical_graph(graph)
+    if split_components:
+        return _write_packed_components(
+            graph, img_fname, for_latex, layout, rankdir, jobs)
+    positions = None
+    if layout_cache is not None:
+        positions, signatures[img_fname] = pinned_positions(
+            graph, layout_cache.get(img_fname))
+        print('{img_fname}: {n} of {m} nodes unchanged'.format(
+            img_fname=img_fname, n=len(positions), m=len(graph)))
+        pinned = pinned_engine(graph, layout, positions)
+        if pinned == 'nop2':
+            print('{img_fname}: layout reused'.format(
+                img_fname=img_fname))
+        elif positions and pinned is None:
+            print((
+                '{img_fname}: too large to lay out around '
+                'unchanged nodes, laying out anew').format(
+                    img_fname=img_fname))
+    return write_merged_graph2dot(
+        graph, img_fname, for_latex, layout, rankdir, backend,
+        positions)
+
+
+def _write_packed_components(
+        graph, img_fname, for_latex, layout, rankdir, jobs):
+    """Lay out components of `graph` and pack them into a `dot` file.
+
+    The `dot` file of each component is written
+    to a temporary directory, removed after packing.
+
+    @return: path of `dot` file
+    @rtype: `str`
+    """
+    _print_layout_estimate(layout, graph, img_fname)
+    dot_dir = tempfile.mkdtemp(prefix='cflow2dot')
+    try:
+        dot_paths = write_merged_components2dot(
+            graph, dot_dir, for_latex, layout, rankdir)
+        print('{img_fname}: laying out {n} components'.format(
+            img_fname=img_fname, n=len(dot_paths)))
+        return pack_components(dot_paths, img_fname, layout, jobs)
+    finally:
+        shutil.rmtree(dot_dir)
 
 
 def main():
@@ -643,47 +2897,142 @@ def main():
     target = args.target
     layout = args.layout
     rankdir = args.rankdir
-    exclude_list_fname = args.exclude
+    if args.exclude:
+        patterns = read_exclusion_patterns(args.exclude)
+    else:
+        patterns = list()
+    # each file parsed alone calls functions
+    # of the other files as externals
+    externals_per_file = (
+        args.exclude_externals and not args.whole_program and
+        len(c_fnames) > 1)
+    exclude = exclusion_matcher(
+        patterns, args.exclude_externals and not externals_per_file)
+    prune = args.prune_excluded
+    stop_at = exclusion_matcher(args.stop_at)
+    depth = args.depth
+    starts = list(args.start)
+    if args.main is not None:
+        starts.insert(0, args.main)
+    backend = args.backend
+    if args.no_dot_files:
+        backend = 'pipe'
+    jobs = args.jobs
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+    if args.no_cache:
+        cache_dir = None
+        render_cache_dir = None
+    else:
+        cache_dir = os.path.join(args.cache_dir, 'cflow')
+        render_cache_dir = os.path.join(args.cache_dir, 'render')
+    cache_size = args.cache_size * 2**20
     # configure the logger
     logger.addHandler(logging.StreamHandler())
     logger.setLevel(args.verbosity)
     logger.info((
         'C source files:\n\t{c_fnames},\n'
-        'img fname:\n\t{img_fname}.{img_format}\n'
+        'img fname:\n\t{img_fname}.{{{img_format}}}\n'
         'LaTeX export from Inkscape:\n\t{for_latex}\n'
         'Multi-page PDF:\n\t{multi_page}').format(
             c_fnames=c_fnames,
             img_fname=img_fname,
-            img_format=img_format,
+            img_format=','.join(img_format),
             for_latex=for_latex,
             multi_page=multi_page))
     print('cflow2dot')
     # input
     cflow, dot = check_cflow_dot_availability()
-    # call `cflow`
-    cflow_strs = list()
-    for c_fname in c_fnames:
-        cur_str = call_cflow(
-            c_fname, cflow, numbered_nesting=True,
-            preprocess=preproc, do_reverse=do_rev)
-        cflow_strs.append(cur_str)
-    # parse `cflow` output
-    graphs = list()
-    for cflow_out, c_fname in zip(cflow_strs, c_fnames):
-        cur_graph = cflow2nx(cflow_out, c_fname)
-        graphs.append(cur_graph)
-    rm_excluded_funcs(exclude_list_fname, graphs)
+    # call `cflow` and parse its output as it arrives
+    if args.whole_program:
+        program_graph = whole_program_graph(
+            c_fnames, cflow, preprocess=preproc,
+            do_reverse=do_rev, cache_dir=cache_dir,
+            brief=args.brief, xref=args.xref, compact=args.compact,
+            exclude=exclude, prune=prune, stop_at=stop_at,
+            depth=depth, starts=starts)
+        if not merge:
+            graphs = split_by_file(program_graph, c_fnames)
+    else:
+        graphs = cflow_graphs(
+            c_fnames, cflow, preprocess=preproc,
+            do_reverse=do_rev, jobs=jobs, cache_dir=cache_dir,
+            brief=args.brief, xref=args.xref, compact=args.compact,
+            exclude=exclude, prune=prune, stop_at=stop_at,
+            depth=depth, starts=starts)
+        if externals_per_file:
+            rm_external_funcs(graphs, c_fnames)
+    if args.whole_program:
+        parsed = [program_graph]
+    else:
+        parsed = graphs
+    if any('truncated_at' in g.graph for g in parsed):
+        print('Calls deeper than {depth} levels were omitted.'.format(
+            depth=depth))
+    if cache_dir is not None:
+        evict_cache(cache_dir, cache_size)
+    if args.layout_cache:
+        layout_cache = load_layout_cache(args.layout_cache)
+    else:
+        layout_cache = None
+    signatures = dict()
     if merge:
-        g = _merge_graphs(graphs, c_fnames)
-        _mark_call_paths(g, source, target)
-        g = _format_merged_graph(g, for_latex)
-        dot_path = _dump_graph_to_dot(g, img_fname, layout, rankdir)
-        dot_paths = [dot_path]
+        if args.whole_program:
+            g = program_graph
+        else:
+            g = _merge_graphs(graphs, c_fnames)
+        # the reverse graph is derived before marking call paths,
+        # which changes edge attributes
+        if args.with_reverse:
+            rev_g = reverse_graph(g)
+        dot_paths = _write_merged_outputs(
+            g, source, target, args.paths_only,
+            args.focus, args.up, args.down,
+            img_fname, for_latex, layout, rankdir, backend,
+            args.split_components, jobs, layout_cache, signatures,
+            args.canonical)
+        if args.with_reverse:
+            # call paths run from callee to caller,
+            # and callers are below callees
+            dot_paths.extend(_write_merged_outputs(
+                rev_g, target, source, args.paths_only,
+                args.focus, args.down, args.up,
+                img_fname + '_reverse', for_latex,
+                layout, rankdir, backend,
+                args.split_components, jobs, layout_cache, signatures,
+                args.canonical))
     else:
         dot_paths = write_graphs2dot(
             graphs, c_fnames, img_fname, for_latex,
-            multi_page, layout, rankdir)
-    dot2img(dot_paths, img_format, layout)
+            multi_page, layout, rankdir, backend, args.canonical)
+        if args.with_reverse:
+            rev_graphs = [reverse_graph(g) for g in graphs]
+            dot_paths.extend(write_graphs2dot(
+                rev_graphs, c_fnames, img_fname + '_reverse',
+                for_latex, multi_page, layout, rankdir, backend,
+                args.canonical))
+    if args.no_dot_files:
+        pipe2img(
+            dot_paths, img_format, layout, jobs=jobs,
+            plain=layout_cache is not None)
+        # where the `dot` files would be, for `update_layout_cache`
+        dot_paths = [
+            img_fname + '.dot' for img_fname, _ in dot_paths]
+    elif args.split_components:
+        # keep the positions from the packed layouts
+        dot2img(
+            dot_paths, img_format, 'neato', jobs=jobs,
+            layout_args=['-n2', '-s'], cache_dir=render_cache_dir)
+    else:
+        dot2img(
+            dot_paths, img_format, layout, jobs=jobs,
+            plain=layout_cache is not None,
+            cache_dir=render_cache_dir)
+    if render_cache_dir is not None:
+        evict_cache(render_cache_dir, cache_size)
+    if layout_cache is not None:
+        update_layout_cache(layout_cache, signatures, dot_paths)
+        save_layout_cache(args.layout_cache, layout_cache)
 
 
 if __name__ == "__main__":
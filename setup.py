@@ -19,8 +19,9 @@ VERSION_TEXT = (
     '# This file was generated from setup.py\n'
     "version = '{version}'\n")
 install_requires = [
-    'networkx >= 2.0',
-    'pydot >= 1.2.3']
+    'networkx >= 2.0']
+extras_require = dict(
+    pydot=['pydot >= 1.2.3'])
 tests_require = ['nose >= 1.3.4']
 classifiers = [
     'Development Status :: 2 - Pre-Alpha',
@@ -90,6 +91,7 @@ def run_setup():
         url=url,
         license='GPLv3',
         install_requires=install_requires,
+        extras_require=extras_require,
         tests_require=tests_require,
         packages=[name],
         package_dir={name: name},
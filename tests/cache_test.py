@@ -0,0 +1,61 @@
+"""Tests of the cache of `cflow` output."""
+import os
+import shutil
+import tempfile
+
+from pycflow2dot import pycflow2dot as cflow2dot
+
+
+def make_cache(sizes):
+    cache_dir = tempfile.mkdtemp()
+    for i, size in enumerate(sizes):
+        path = os.path.join(cache_dir, 'entry{i}'.format(i=i))
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        # older entries first
+        os.utime(path, (i, i))
+    return cache_dir
+
+
+def test_evict_least_recently_used():
+    cache_dir = make_cache([10, 10, 10])
+    try:
+        cflow2dot.evict_cache(cache_dir, 25)
+        assert sorted(os.listdir(cache_dir)) == ['entry1', 'entry2']
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_evict_entries_removed_meanwhile():
+    cache_dir = make_cache([10, 10, 10])
+    remove = os.remove
+
+    def remove_twice(path):
+        # another run evicted the entry first
+        remove(path)
+        remove(path)
+    os.remove = remove_twice
+    try:
+        cflow2dot.evict_cache(cache_dir, 5)
+    finally:
+        os.remove = remove
+        shutil.rmtree(cache_dir)
+
+
+def test_cached_lines_read_after_eviction():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        cflow_cmd = ['cflow', '-l', 'a.c']
+        key = cflow2dot._cflow_cache_key(cflow_cmd, [], 'cflow 1.7')
+        path = os.path.join(cache_dir, key)
+        with open(path, 'wb') as f:
+            f.write(b'{   0} main() <int main (void) at a.c:1>:\n')
+        lines = cflow2dot._cached_cflow_lines(
+            cflow_cmd, [], cache_dir, 'cflow 1.7')
+        if os.name == 'posix':
+            # evicted by another run, after found here
+            os.remove(path)
+        g = cflow2dot.cflow2nx(lines, 'a.c')
+        assert list(g) == ['main'], list(g)
+    finally:
+        shutil.rmtree(cache_dir)
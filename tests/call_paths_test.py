@@ -0,0 +1,68 @@
+"""Tests of marking call paths in merged graphs."""
+import networkx as nx
+
+from pycflow2dot import pycflow2dot as cflow2dot
+
+
+def dashed_edges(g):
+    return set(
+        (u, v) for u, v, style in g.edges(data='style')
+        if style == '"dashed"')
+
+
+def simple_path_edges(g, source, target):
+    edges = set()
+    for path in nx.all_simple_paths(g, source, target):
+        edges.update(zip(path, path[1:]))
+    return edges
+
+
+def test_acyclic():
+    graphs = [
+        [('s', 't')],
+        [('s', 'a'), ('a', 't'), ('s', 'b'), ('b', 't'), ('b', 'c')],
+        [('s', 'a'), ('a', 'b'), ('b', 't'), ('a', 't'),
+            ('x', 'a'), ('b', 'y'), ('s', 'y')]]
+    for edges in graphs:
+        g = nx.DiGraph(edges)
+        nodes = cflow2dot._mark_call_paths(g, 's', 't')
+        expected = simple_path_edges(g, 's', 't')
+        assert dashed_edges(g) == expected, (edges, dashed_edges(g))
+        path_nodes = set(u for edge in expected for u in edge)
+        assert nodes == path_nodes, nodes
+
+
+def test_recursion():
+    # `a` and `c` call each other, `b` calls itself,
+    # and `d` is called from the paths, but reaches none
+    g = nx.DiGraph([
+        ('s', 'a'), ('a', 'b'), ('b', 't'),
+        ('a', 'c'), ('c', 'a'), ('b', 'b'),
+        ('a', 'd'), ('d', 'd')])
+    nodes = cflow2dot._mark_call_paths(g, 's', 't')
+    dashed = dashed_edges(g)
+    simple = simple_path_edges(g, 's', 't')
+    assert simple == set([('s', 'a'), ('a', 'b'), ('b', 't')])
+    # the cycles through the paths are walked too
+    assert dashed - simple == set([('a', 'c'), ('c', 'a'), ('b', 'b')])
+    assert simple <= dashed
+    assert nodes == set('sabct'), nodes
+
+
+def test_no_path():
+    g = nx.DiGraph([('s', 'a'), ('t', 'a')])
+    assert cflow2dot._mark_call_paths(g, 's', 't') == set()
+    assert not dashed_edges(g)
+    assert cflow2dot._mark_call_paths(g, None, 't') is None
+
+
+def test_paths_only_without_path():
+    g = nx.DiGraph([('s', 'a'), ('t', 'a')])
+    try:
+        cflow2dot._write_merged_outputs(
+            g, 's', 't', True, None, None, None,
+            'never_written', False, 'dot', 'LR', 'native')
+    except Exception as e:
+        assert 'No call path' in str(e), e
+    else:
+        raise AssertionError('no path, but drawn')
@@ -0,0 +1,69 @@
+"""Tests of parsing lines of `cflow -l` output."""
+from pycflow2dot import pycflow2dot as cflow2dot
+
+
+tokenize = cflow2dot._tokenize_cflow_line
+
+
+def test_defined():
+    line = '{   1}     foo() <void foo (int x) at foo.c:3>:'
+    assert tokenize(line) == (1, 'foo', 'foo.c', 3, None)
+
+
+def test_undefined():
+    assert tokenize('{   2}         printf()') == (2, 'printf', None, -1, None)
+
+
+def test_recursive():
+    line = '{   0} rec() <int rec (int n) at rec.c:20> (R):'
+    assert tokenize(line) == (0, 'rec', 'rec.c', 20, None)
+    # a recursive call is a leaf, without a reference
+    line = (
+        '{   1}     rec() <int rec (int n) at rec.c:20> '
+        '(recursive: see 9)')
+    assert tokenize(line) == (1, 'rec', 'rec.c', 20, None)
+
+
+def test_brief_reference():
+    line = '{   3}         foo() <void foo (int x) at foo.c:3> [see 2]'
+    assert tokenize(line) == (3, 'foo', 'foo.c', 3, 2)
+    line = (
+        '{  12}                         rec() '
+        '<int rec (int n) at rec.c:20> (R) [see 140]')
+    assert tokenize(line) == (12, 'rec', 'rec.c', 20, 140)
+
+
+def test_parameter_named_at():
+    line = '{   1}     put() <void put (char *at, int n) at buf.c:41>:'
+    assert tokenize(line) == (1, 'put', 'buf.c', 41, None)
+    line = '{   1}     put() <void put (int at) at buf.c:41> [see 7]'
+    assert tokenize(line) == (1, 'put', 'buf.c', 41, 7)
+
+
+def test_path_with_colon():
+    line = '{   0} main() <int main (void) at C:/src/main.c:5>:'
+    assert tokenize(line) == (0, 'main', 'C:/src/main.c', 5, None)
+
+
+def test_bytes():
+    line = b'{   1}     foo() <void foo (int x) at foo.c:3> [see 2]'
+    tokens = tokenize(line)
+    assert tokens == (1, 'foo', 'foo.c', 3, 2), tokens
+    # names are decoded
+    assert not isinstance(tokens[1], bytes)
+    assert not isinstance(tokens[2], bytes)
+    assert tokenize(b'{   0} printf()') == (0, 'printf', None, -1, None)
+
+
+def test_not_tree():
+    assert tokenize('') is None
+    assert tokenize('foo * foo.c:3 void foo (int x)') is None
+    assert tokenize(b'cflow: foo.c:1: warning') is None
+
+
+def test_nest_level_of():
+    nest_level_of = cflow2dot._nest_level_of
+    assert nest_level_of('{  12}     foo()') == 12
+    assert nest_level_of(b'{   0} main() <int main (void) at m.c:1>:') == 0
+    assert nest_level_of('no tree') is None
+    assert nest_level_of(b'{ x} foo()') is None
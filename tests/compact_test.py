@@ -0,0 +1,213 @@
+"""Tests of `pycflow2dot.compact` against the `networkx` graphs."""
+import pickle
+
+from pycflow2dot import pycflow2dot as cflow2dot
+from pycflow2dot.compact import CompactCallGraph
+
+
+# recorded output of `cflow -l`
+CFLOW_A = '''\
+{   0} main() <int main (void) at a.c:10>:
+{   1}     printf()
+{   1}     foo() <void foo (int x) at a.c:3>:
+{   2}         bar()
+{   2}         baz() <int baz (void) at a.c:7>:
+{   3}             printf()
+{   1}     node()
+{   1}     baz() <int baz (void) at a.c:7>:
+{   2}         printf()
+{   1}     rec() <int rec (void) at a.c:20> (R):
+{   2}         rec() <int rec (void) at a.c:20> (recursive: see 9)
+'''
+CFLOW_B = '''\
+{   0} bar() <void bar (void) at b.c:2>:
+{   1}     qux() <int qux (void) at b.c:8>:
+{   2}         malloc()
+{   2}         baz()
+{   0} lonely() <void lonely (void) at b.c:12>:
+{   1}     puts()
+'''
+
+
+def parse_both(cflow_str, c_fname='a.c'):
+    return (
+        cflow2dot.cflow2nx(cflow_str, c_fname),
+        cflow2dot.cflow2compact(cflow_str, c_fname))
+
+
+def assert_same_graph(compact, graph):
+    assert isinstance(compact, CompactCallGraph), compact
+    assert len(compact) == len(graph), (len(compact), len(graph))
+    assert list(compact) == list(graph), (list(compact), list(graph))
+    for u, d in graph.nodes(data=True):
+        assert u in compact, u
+        assert compact.nodes[u] == d, (u, compact.nodes[u], d)
+    edges = sorted(compact.edges(data=True))
+    nx_edges = sorted(graph.edges(data=True))
+    assert edges == nx_edges, (edges, nx_edges)
+    assert compact.number_of_edges() == graph.number_of_edges()
+    for u in graph:
+        assert sorted(compact.successors(u)) == sorted(graph.successors(u))
+        assert (
+            sorted(compact.predecessors(u)) ==
+            sorted(graph.predecessors(u)))
+        assert compact.in_degree(u) == graph.in_degree(u)
+        for v in graph:
+            assert compact.has_edge(u, v) == graph.has_edge(u, v), (u, v)
+    assert compact.graph == graph.graph, (compact.graph, graph.graph)
+
+
+def test_parse():
+    g, c = parse_both(CFLOW_A)
+    assert_same_graph(c, g)
+    assert c.has_edge('rec', 'rec')
+    assert c.nodes['printf'] == dict(nest_level=1, src_line=-1)
+
+
+def test_parse_bytes():
+    lines = CFLOW_A.encode('ascii').splitlines(True)
+    c = cflow2dot.cflow2compact(lines, 'a.c')
+    g, _ = parse_both(CFLOW_A)
+    assert_same_graph(c, g)
+
+
+def test_parse_with_depth():
+    g = cflow2dot.cflow2nx(CFLOW_A, 'a.c', max_depth=1)
+    c = cflow2dot.cflow2compact(CFLOW_A, 'a.c', max_depth=1)
+    assert_same_graph(c, g)
+    assert c.graph['truncated_at'] == 1
+
+
+def test_freeze_removes_duplicate_edges():
+    c = CompactCallGraph()
+    u = c.add_node('u', 0, 1)
+    v = c.add_node('v', 1, 2)
+    w = c.add_node('w', 1, -1)
+    c.add_edge_ids(u, v)
+    c.add_edge_ids(u, w)
+    c.add_edge_ids(u, v)
+    c.freeze()
+    assert list(c.edges()) == [('u', 'v'), ('u', 'w')]
+    # edges added after freezing
+    c.add_edge_ids(w, v)
+    c.add_edge_ids(u, w)
+    assert list(c.edges()) == [('u', 'v'), ('u', 'w'), ('w', 'v')]
+    assert sorted(c.predecessors('v')) == ['u', 'w']
+    assert c.has_edge('w', 'v')
+    assert not c.has_edge('v', 'w')
+
+
+def test_add_node_keeps_first_attributes():
+    c = CompactCallGraph()
+    c.add_node('f', 2, -1)
+    c.add_node('f', 1, 5, 'a.c')
+    assert c.nodes['f'] == dict(nest_level=2, src_line=5, file_name='a.c')
+    c.add_node('f', 0, 7, 'b.c')
+    assert c.nodes['f'] == dict(nest_level=2, src_line=5, file_name='a.c')
+
+
+def test_merge():
+    fnames = ['a.c', 'b.c']
+    ga, ca = parse_both(CFLOW_A, 'a.c')
+    gb, cb = parse_both(CFLOW_B, 'b.c')
+    g = cflow2dot._merge_graphs([ga, gb], fnames)
+    c = cflow2dot._merge_graphs([ca, cb], fnames)
+    assert isinstance(c, CompactCallGraph)
+    # `networkx.compose_all` keeps the nest level of the last
+    # graph, the compact merge that of the first, and
+    # merged graphs are dumped without nest levels
+    for u, d in g.nodes(data=True):
+        d['nest_level'] = c.nodes[u]['nest_level']
+    assert_same_graph(c, g)
+    assert c.nodes['bar']['file_name'] == 'b.c'
+    assert c.nodes['bar']['src_line'] == 2
+    assert 'file_name' not in c.nodes['printf']
+
+
+def test_reverse():
+    g, c = parse_both(CFLOW_A)
+    rev_g = cflow2dot.reverse_graph(g)
+    rev_c = cflow2dot.reverse_graph(c)
+    assert_same_graph(rev_c, rev_g)
+    assert rev_c.has_edge('printf', 'baz')
+    assert rev_c.nodes['printf']['nest_level'] == 0
+    # the original is unchanged
+    assert_same_graph(c, g)
+
+
+def test_subgraph():
+    g, c = parse_both(CFLOW_A)
+    nodes = {'main', 'foo', 'baz', 'printf'}
+    sub_g = cflow2dot.induced_subgraph(g, nodes)
+    sub_c = cflow2dot.induced_subgraph(c, nodes)
+    assert_same_graph(sub_c, sub_g)
+    assert 'bar' not in sub_c
+    assert 'bar' in c
+
+
+def test_remove_nodes():
+    g, c = parse_both(CFLOW_A)
+    for graph in (g, c):
+        graph.remove_node('foo')
+        graph.remove_nodes_from(['node_', 'no_such_function'])
+    assert_same_graph(c, g)
+    assert not c.has_edge('foo', 'bar')
+    assert not c.has_edge('main', 'foo')
+    # removed nodes are skipped by reverse and subgraph too
+    assert_same_graph(
+        cflow2dot.reverse_graph(c), cflow2dot.reverse_graph(g))
+    nodes = {'main', 'foo', 'baz'}
+    assert_same_graph(
+        cflow2dot.induced_subgraph(c, nodes),
+        cflow2dot.induced_subgraph(g, nodes))
+
+
+def test_remove_missing_node():
+    _, c = parse_both(CFLOW_A)
+    c.remove_node('foo')
+    try:
+        c.remove_node('foo')
+    except KeyError:
+        pass
+    else:
+        raise AssertionError('removed node removed again')
+
+
+def test_edge_attributes():
+    g, c = parse_both(CFLOW_A)
+    for graph in (g, c):
+        cflow2dot._mark_call_paths(graph, 'main', 'printf')
+    assert_same_graph(c, g)
+    assert c.edges['foo', 'baz'] == dict(style='"dashed"')
+    assert c.edges['main', 'node_'] == dict()
+    try:
+        c.edges['bar', 'foo']
+    except KeyError:
+        pass
+    else:
+        raise AssertionError('attributes of missing edge')
+    # attributes are copied by reverse and subgraph
+    rev = c.reverse()
+    assert rev.edges['baz', 'foo'] == dict(style='"dashed"')
+    sub = c.subgraph({'main', 'foo', 'baz'})
+    sub.edges['main', 'foo']['color'] = 'red'
+    assert 'color' not in c.edges['main', 'foo']
+
+
+def test_networkx_round_trip():
+    g, _ = parse_both(CFLOW_A)
+    g.graph['truncated_at'] = 3
+    c = CompactCallGraph.from_networkx(g)
+    assert_same_graph(c, g)
+    h = c.to_networkx()
+    assert list(h.nodes(data=True)) == list(g.nodes(data=True))
+    assert sorted(h.edges(data=True)) == sorted(g.edges(data=True))
+    assert h.graph == g.graph
+
+
+def test_pickle():
+    g, c = parse_both(CFLOW_A)
+    c.remove_node('node_')
+    g.remove_node('node_')
+    c = pickle.loads(pickle.dumps(c, pickle.HIGHEST_PROTOCOL))
+    assert_same_graph(c, g)
@@ -0,0 +1,48 @@
+"""Tests of the native `dot` writer."""
+from pycflow2dot import pycflow2dot as cflow2dot
+
+
+CFLOW_A = '''\
+{   0} main() <int main (void) at a.c:10>:
+{   1}     printf()
+{   1}     bar()
+'''
+CFLOW_B = '''\
+{   0} bar() <void bar (void) at b.c:2>:
+{   1}     puts()
+'''
+
+
+def test_dot_format_edge_color():
+    # the third argument was a color before
+    s = cflow2dot.dot_format_edge('main', 'foo', '#000000')
+    assert s == 'main -> foo [color="#000000"];\n', s
+    s = cflow2dot.dot_format_edge('main', 'foo', dict(style='dashed'))
+    assert s == 'main -> foo [style=dashed];\n', s
+    assert cflow2dot.dot_format_edge('main', 'foo', dict()) == (
+        'main -> foo;\n')
+
+
+def test_dump_dot_with_other_graphs():
+    a = cflow2dot.cflow2nx(CFLOW_A, 'a.c')
+    b = cflow2dot.cflow2nx(CFLOW_B, 'b.c')
+    definitions = cflow2dot.definition_index([a, b], ['a.c', 'b.c'])
+    # the graphs of the other files were passed before
+    # `definition_index`, and link the same nodes
+    for multi_page in (False, True):
+        s = cflow2dot.dump_dot_wo_pydot(
+            a, [b], 'a.c', False, multi_page, 'LR')
+        t = cflow2dot.dump_dot_wo_pydot(
+            a, definitions, 'a.c', False, multi_page, 'LR')
+        assert s == t, (s, t)
+    assert 'descref[bar]{bar}' in t, t
+    assert 'descref[printf]' not in t, t
+
+
+def test_node_defined_in_other_src():
+    a = cflow2dot.cflow2nx(CFLOW_A, 'a.c')
+    b = cflow2dot.cflow2nx(CFLOW_B, 'b.c')
+    assert cflow2dot.node_defined_in_other_src('bar', [b])
+    assert not cflow2dot.node_defined_in_other_src('bar', [a])
+    assert not cflow2dot.node_defined_in_other_src('puts', [a, b])
+    assert not cflow2dot.node_defined_in_other_src('bar', [])
@@ -0,0 +1,126 @@
+"""Tests of excluding functions from call graphs."""
+from pycflow2dot import pycflow2dot as cflow2dot
+
+
+# recorded output of `cflow -l` on each file
+CFLOW_A = '''\
+{   0} main() <int main (void) at a.c:10>:
+{   1}     printf()
+{   1}     foo() <void foo (int x) at a.c:3>:
+{   2}         bar()
+{   2}         puts()
+'''
+CFLOW_B = '''\
+{   0} bar() <void bar (void) at b.c:2>:
+{   1}     malloc()
+'''
+
+# recorded output of `cflow -l`, with `log_init` called
+# under `log_open`, and by `main`
+CFLOW_LOG = '''\
+{   0} main() <int main (void) at log.c:30>:
+{   1}     log_open() <void log_open (void) at log.c:10>:
+{   2}         log_init() <void log_init (void) at log.c:3>:
+{   3}             malloc()
+{   2}         fopen()
+{   1}     log_init() <void log_init (void) at log.c:3>:
+{   2}         malloc()
+{   1}     run() <int run (void) at log.c:20>:
+{   2}         printf()
+'''
+
+
+def test_externals_per_file():
+    c_fnames = ['a.c', 'b.c']
+    for parse in (cflow2dot.cflow2nx, cflow2dot.cflow2compact):
+        graphs = [
+            parse(CFLOW_A, 'a.c'),
+            parse(CFLOW_B, 'b.c')]
+        cflow2dot.rm_external_funcs(graphs, c_fnames)
+        a, b = graphs
+        # `bar` is defined in another input file
+        assert sorted(a) == ['bar', 'foo', 'main'], sorted(a)
+        assert a.has_edge('foo', 'bar')
+        assert sorted(b) == ['bar'], sorted(b)
+        g = cflow2dot._merge_graphs(graphs, c_fnames)
+        assert g.has_edge('foo', 'bar')
+
+
+def test_externals_single_file():
+    exclude = cflow2dot.exclusion_matcher([], externals=True)
+    g = cflow2dot.cflow2nx(CFLOW_A, 'a.c', exclude=exclude)
+    assert sorted(g) == ['foo', 'main'], sorted(g)
+
+
+def test_matcher_patterns():
+    match = cflow2dot.exclusion_matcher([
+        'printf', 'log_*', 're:(?i)ERR.*', 're:x|xy'])
+    assert match('printf', -1)
+    assert match('log_open', 10)
+    assert match('err_report', 5)
+    assert match('Error', 5)
+    # regular expressions match whole names
+    assert match('xy', 5)
+    assert not match('xyz', 5)
+    assert not match('printf_', -1)
+    assert not match('main', 30)
+    assert cflow2dot.exclusion_matcher([]) is None
+
+
+def test_matcher_regexes_compiled_alone():
+    # the same group name in two patterns
+    match = cflow2dot.exclusion_matcher([
+        're:(?P<p>get)_.*', 're:(?P<p>set)_.*'])
+    assert match('get_x', 1)
+    assert match('set_x', 1)
+    assert not match('put_x', 1)
+
+
+def test_matcher_invalid_regex():
+    for pattern in ('re:(', 're:a(?i)b'):
+        try:
+            cflow2dot.exclusion_matcher([pattern])
+        except ValueError as e:
+            assert pattern in str(e), e
+        else:
+            raise AssertionError(pattern)
+
+
+def test_matcher_externals():
+    match = cflow2dot.exclusion_matcher([], externals=True)
+    assert match('printf', -1)
+    assert not match('main', 30)
+
+
+def test_exclude_makes_callees_roots():
+    exclude = cflow2dot.exclusion_matcher(['log_open'])
+    g = cflow2dot.cflow2nx(CFLOW_LOG, 'log.c', exclude=exclude)
+    assert 'log_open' not in g
+    # the lines under `log_open` are parsed,
+    # and `log_init` keeps its callees
+    assert 'fopen' in g
+    assert g.has_edge('log_init', 'malloc')
+    assert g.has_edge('main', 'log_init')
+
+
+def test_prune():
+    exclude = cflow2dot.exclusion_matcher(['log_open'])
+    for parse in (cflow2dot.cflow2nx, cflow2dot.cflow2compact):
+        g = parse(CFLOW_LOG, 'log.c', exclude=exclude, prune=True)
+        assert sorted(g) == [
+            'log_init', 'main', 'malloc', 'printf', 'run'], sorted(g)
+        # `log_init` is expanded again under `main`
+        assert g.has_edge('log_init', 'malloc')
+        assert g.has_edge('run', 'printf')
+
+
+def test_stop_at():
+    stop_at = cflow2dot.exclusion_matcher(['log_*'])
+    for parse in (cflow2dot.cflow2nx, cflow2dot.cflow2compact):
+        g = parse(CFLOW_LOG, 'log.c', stop_at=stop_at)
+        assert sorted(g) == [
+            'log_init', 'log_open', 'main', 'printf', 'run'], sorted(g)
+        assert g.has_edge('main', 'log_open')
+        assert g.has_edge('main', 'log_init')
+        assert not g.has_edge('log_open', 'log_init')
+        assert g.has_edge('run', 'printf')
@@ -0,0 +1,117 @@
+"""Tests of building graphs from `cflow --xref` output."""
+from pycflow2dot import pycflow2dot as cflow2dot
+
+
+# recorded output of `cflow --xref x.c y.c`, where:
+#   - `bar` is declared on line 1 of `x.c`,
+#     before any function is defined
+#   - `dead` is not reachable from `main`
+#   - `printf` is referenced on line 1 of `y.c`,
+#     before any function of `y.c` is defined
+XREF = '''\
+bar * x.c:9 int bar (void)
+bar   x.c:1
+bar   x.c:5
+baz * y.c:2 int baz (void)
+baz   x.c:16
+dead * x.c:20 void dead (void)
+foo * x.c:3 void foo (int x)
+foo   x.c:15
+main * x.c:13 int main (void)
+node   x.c:17
+printf   x.c:10
+printf   x.c:21
+printf   y.c:1
+puts   y.c:4
+'''
+EDGES = [
+    ('bar', 'printf'),
+    ('baz', 'puts'),
+    ('foo', 'bar'),
+    ('main', 'baz'),
+    ('main', 'foo'),
+    ('main', 'node_')]
+
+
+def xref_lines(drop):
+    """Return lines of `XREF` without those of functions `drop`."""
+    return [
+        line for line in XREF.splitlines()
+        if line.split()[0] not in drop]
+
+
+def test_references_attributed_to_callers():
+    g = cflow2dot.xref2nx(XREF, 'x.c')
+    assert sorted(g.edges()) == EDGES, sorted(g.edges())
+    assert g.nodes['main'] == dict(src_line=13, nest_level=0)
+    assert g.nodes['printf'] == dict(src_line=-1, nest_level=3)
+    levels = dict(g.nodes(data='nest_level'))
+    assert levels == dict(
+        main=0, foo=1, baz=1, node_=1, bar=2, puts=2, printf=3), levels
+
+
+def test_references_before_definitions_ignored():
+    g = cflow2dot.xref2nx(xref_lines(['main']), 'x.c')
+    # the declaration of `bar` on line 1 is not a call,
+    # and `printf` on line 1 of `y.c` is not attributed
+    # to `dead`, defined last before it in `x.c`
+    assert list(g.predecessors('bar')) == ['foo']
+    assert sorted(g.predecessors('printf')) == ['bar', 'dead']
+
+
+def test_unreachable_from_main_removed():
+    g = cflow2dot.xref2nx(XREF, 'x.c')
+    assert 'dead' not in g
+    assert len(g) == 7, list(g)
+
+
+def test_all_kept_without_main():
+    g = cflow2dot.xref2nx(xref_lines(['main']), 'x.c')
+    assert 'dead' in g
+    assert g.has_edge('dead', 'printf')
+    # without the definition of `main`, its calls
+    # are attributed to `bar`, defined last before them
+    assert sorted(g.successors('bar')) == ['baz', 'foo', 'node_', 'printf']
+    roots = sorted(u for u, d in g.nodes(data=True) if d['nest_level'] == 0)
+    # `bar` is on a cycle, so searched from in turn
+    assert roots == ['bar', 'dead'], roots
+
+
+def test_main_declared_only():
+    lines = xref_lines(['main']) + ['main   x.c:30']
+    g = cflow2dot.xref2nx(lines, 'x.c')
+    assert 'dead' in g
+    assert g.nodes['main']['src_line'] == -1
+
+
+def test_exclude_after_table_read():
+    exclude = cflow2dot.exclusion_matcher(['bar'], externals=True)
+    g = cflow2dot.xref2nx(XREF, 'x.c', exclude=exclude)
+    assert sorted(g) == ['baz', 'foo', 'main'], sorted(g)
+    assert sorted(g.edges()) == [('main', 'baz'), ('main', 'foo')]
+    assert g.nodes['foo']['nest_level'] == 1
+
+
+def test_stop_at():
+    stop_at = cflow2dot.exclusion_matcher(['foo'])
+    g = cflow2dot.xref2nx(XREF, 'x.c', stop_at=stop_at)
+    assert 'foo' in g
+    assert g.out_degree('foo') == 0
+    # reachable from `main` only through `foo`
+    assert 'bar' not in g
+    assert 'printf' not in g
+
+
+def test_file_names():
+    g = cflow2dot.xref2nx(XREF, None, file_names=True)
+    assert g.nodes['main']['file_name'] == 'x.c'
+    assert g.nodes['baz']['file_name'] == 'y.c'
+    assert 'file_name' not in g.nodes['printf']
+
+
+def test_bytes():
+    lines = XREF.encode('ascii').splitlines(True)
+    g = cflow2dot.xref2nx(lines, None, file_names=True)
+    h = cflow2dot.xref2nx(XREF, None, file_names=True)
+    assert sorted(g.edges()) == EDGES
+    assert dict(g.nodes(data=True)) == dict(h.nodes(data=True))